@@ -0,0 +1 @@
+# Puts the repository root on sys.path, so `pytest tests` can import lib like the server does
@@ -6,6 +6,13 @@ from __future__ import absolute_import
 
 import numpy as np
 
+# Lambdas closer than this (relative) are treated as the same turning point
+LAMBDA_TOL=1e-9
+# Free-set inverse is refactored from scratch after this many updates
+REFACTOR_INTERVAL=10
+# solve() gives up after this many turning points per asset (plus one)
+MAX_ITER_PER_ASSET=20
+
 #---------------------------------------------------------------
 #---------------------------------------------------------------
 
@@ -21,154 +28,179 @@ class CLA:
         self.g=[] # gammas
         self.f=[] # free weights
 #---------------------------------------------------------------
-    def solve(self):
+    def solve(self,maxIter=None):
         # Compute the turning points,free sets and weights
+        # The inverse of the free covariance matrix is carried from one turning
+        # point to the next and updated as a single weight enters (bordering) or
+        # leaves (downdate) the free set. It is refactored from covarF every
+        # REFACTOR_INTERVAL updates so rounding errors do not accumulate.
+        # Lambdas never increase, a weight can only be freed at a lambda below
+        # the current one (relative LAMBDA_TOL), and the weight that changed
+        # state at the last turning point can not change back at this one - in
+        # exact arithmetic it never would, with rounding errors it could cycle.
+        n=self.mean.shape[0]
+        if maxIter is None:maxIter=MAX_ITER_PER_ASSET*(n+1)
         f,w=self.initAlgo()
+        covarF_inv=self.freeInv(f)
         self.w.append(np.copy(w)) # store solution
         self.l.append(None)
         self.g.append(None)
         self.f.append(f[:])
+        justFreed,justBounded,updates=None,None,0
         while True:
+            if len(self.l)>maxIter:
+                raise RuntimeError("Critical Line Algorithm did not finish in %d turning points" % maxIter)
+            lPrev=self.l[-1]
             #1) case a): Bound one free weight
             l_in=None
             if len(f)>1:
-                covarF,covarFB,meanF,wB=self.getMatrices(f)
-                covarF_inv=np.linalg.inv(covarF)
-                j=0
-                for i in f:
-                    l,bi=self.computeLambda(covarF_inv,covarFB,meanF,wB,j,[self.lB[i],self.uB[i]])
-                    if l>l_in:l_in,i_in,bi_in=l,i,bi
-                    j+=1
+                l,bi=self.computeLambdasIn(covarF_inv,f,w)
+                valid=np.isfinite(l)
+                if lPrev is not None:
+                    valid&=l<=lPrev+LAMBDA_TOL*abs(lPrev)
+                    if justFreed is not None:valid&=np.array(f)!=justFreed
+                if valid.any():
+                    j=np.flatnonzero(valid)[np.argmax(l[valid])]
+                    l_in,i_in,bi_in=l[j],f[j],bi[j]
+                    if lPrev is not None:l_in=min(l_in,lPrev)
             #2) case b): Free one bounded weight
             l_out=None
-            if len(f)<self.mean.shape[0]:
+            if len(f)<n:
                 b=self.getB(f)
-                for i in b:
-                    covarF,covarFB,meanF,wB=self.getMatrices(f+[i])
-                    covarF_inv=np.linalg.inv(covarF)
-                    l,bi=self.computeLambda(covarF_inv,covarFB,meanF,wB,meanF.shape[0]-1, \
-                        self.w[-1][i])
-                    if (self.l[-1]==None or l<self.l[-1]) and l>l_out:l_out,i_out=l,i
-            if (l_in==None or l_in<0) and (l_out==None or l_out<0):
+                l=self.computeLambdasOut(covarF_inv,f,b,w)
+                valid=np.isfinite(l)
+                if lPrev is not None:valid&=l<lPrev-LAMBDA_TOL*abs(lPrev)
+                if justBounded is not None:valid&=b!=justBounded
+                if valid.any():
+                    j=np.flatnonzero(valid)[np.argmax(l[valid])]
+                    l_out,i_out=l[j],b[j]
+            if (l_in is None or l_in<0) and (l_out is None or l_out<0):
                 #3) compute minimum variance solution
                 self.l.append(0)
-                covarF,covarFB,meanF,wB=self.getMatrices(f)
-                covarF_inv=np.linalg.inv(covarF)
-                meanF=np.zeros(meanF.shape)
+                meanF=np.zeros(len(f))
             else:
                 #4) decide lambda
-                if l_in>l_out:
+                updates+=1
+                if l_out is None or (l_in is not None and l_in>l_out):
                     self.l.append(l_in)
-                    f.remove(i_in)
+                    j=f.index(i_in)
+                    covarF_inv=self.downdateInv(covarF_inv,j)
+                    del f[j]
                     w[i_in]=bi_in # set value at the correct boundary
+                    justFreed,justBounded=None,i_in
                 else:
                     self.l.append(l_out)
+                    covarF_inv=self.borderInv(covarF_inv,f,i_out)
                     f.append(i_out)
-                covarF,covarFB,meanF,wB=self.getMatrices(f)
-                covarF_inv=np.linalg.inv(covarF)
+                    justFreed,justBounded=i_out,None
+                if updates%REFACTOR_INTERVAL==0:covarF_inv=self.freeInv(f)
+                meanF=self.mean[f,0]
             #5) compute solution vector
-            wF,g=self.computeW(covarF_inv,covarFB,meanF,wB)
-            for i in range(len(f)):w[f[i]]=wF[i]
+            wF,g=self.computeW(covarF_inv,f,w,meanF)
+            w[f,0]=wF
             self.w.append(np.copy(w)) # store solution
             self.g.append(g)
             self.f.append(f[:])
             if self.l[-1]==0:break
         #6) Purge turning points
         self.purgeNumErr(10e-10)
+        self.purgeDuplicates(1e-12)
         self.purgeExcess()
 #---------------------------------------------------------------
     def initAlgo(self):
         # Initialize the algo
-        #1) Form structured array
-        a=np.zeros((self.mean.shape[0]),dtype=[('id',int),('mu',float)])
-        b=[self.mean[i][0] for i in range(self.mean.shape[0])] # dump array into list
-        a[:]=zip(range(self.mean.shape[0]),b) # fill structured array
-        #2) Sort structured array
-        b=np.sort(a,order='mu')
-        #3) First free weight
-        i,w=b.shape[0],np.copy(self.lB)
-        while sum(w)<1:
+        #1) Sort assets by mean (stable, so ties keep their original order)
+        order=np.argsort(self.mean[:,0],kind='mergesort')
+        #2) First free weight
+        i,w=order.shape[0],np.copy(self.lB).astype(float)
+        while w.sum()<1:
             i-=1
-            w[b[i][0]]=self.uB[b[i][0]]
-        w[b[i][0]]+=1-sum(w)
-        return [b[i][0]],w
+            w[order[i]]=self.uB[order[i]]
+        w[order[i]]+=1-w.sum()
+        return [int(order[i])],w
 #---------------------------------------------------------------
-    def computeBi(self,c,bi):
-        if c>0:
-            bi=bi[1][0]
-        if c<0:
-            bi=bi[0][0]
-        return bi
+    def freeInv(self,f):
+        # Inverse of covar[f,f], solved for rather than inverted directly
+        return np.linalg.solve(self.covar[np.ix_(f,f)],np.eye(len(f)))
 #---------------------------------------------------------------
-    def computeW(self,covarF_inv,covarFB,meanF,wB):
-        #1) compute gamma
-        onesF=np.ones(meanF.shape)
-        g1=np.dot(np.dot(onesF.T,covarF_inv),meanF)
-        g2=np.dot(np.dot(onesF.T,covarF_inv),onesF)
-        if wB==None:
-            g,w1=float(-self.l[-1]*g1/g2+1/g2),0
-        else:
-            onesB=np.ones(wB.shape)
-            g3=np.dot(onesB.T,wB)
-            g4=np.dot(covarF_inv,covarFB)
-            w1=np.dot(g4,wB)
-            g4=np.dot(onesF.T,w1)
-            g=float(-self.l[-1]*g1/g2+(1-g3+g4)/g2)
-        #2) compute weights
-        w2=np.dot(covarF_inv,onesF)
-        w3=np.dot(covarF_inv,meanF)
-        return -w1+g*w2+self.l[-1]*w3,g
+    def borderInv(self,covarF_inv,f,i):
+        # Inverse of covar[f+[i],f+[i]] from the inverse of covar[f,f]
+        u=np.dot(covarF_inv,self.covar[f,i])
+        s=self.covar[i,i]-np.dot(self.covar[f,i],u)
+        k=len(f)
+        inv=np.empty((k+1,k+1))
+        inv[:k,:k]=covarF_inv+np.outer(u,u)/s
+        inv[:k,k]=inv[k,:k]=-u/s
+        inv[k,k]=1/s
+        return inv
 #---------------------------------------------------------------
-    def computeLambda(self,covarF_inv,covarFB,meanF,wB,i,bi):
-        #1) C
-        onesF=np.ones(meanF.shape)
-        c1=np.dot(np.dot(onesF.T,covarF_inv),onesF)
-        c2=np.dot(covarF_inv,meanF)
-        c3=np.dot(np.dot(onesF.T,covarF_inv),meanF)
-        c4=np.dot(covarF_inv,onesF)
-        c=-c1*c2[i]+c3*c4[i]
-        if c==0:return None,None
-        #2) bi
-        if type(bi)==list:bi=self.computeBi(c,bi)
-        #3) Lambda
-        if wB==None:
-            # All free assets
-            return float((c4[i]-c1*bi)/c),bi
-        else:
-            onesB=np.ones(wB.shape)
-            l1=np.dot(onesB.T,wB)
-            l2=np.dot(covarF_inv,covarFB)
-            l3=np.dot(l2,wB)
-            l2=np.dot(onesF.T,l3)
-            return float(((1-l1+l2)*c4[i]-c1*(bi+l3[i]))/c),bi
+    def downdateInv(self,covarF_inv,j):
+        # Inverse of covar[f,f] with the j-th free weight removed
+        keep=np.delete(np.arange(covarF_inv.shape[0]),j)
+        col=covarF_inv[keep,j]
+        return covarF_inv[np.ix_(keep,keep)]-np.outer(col,col)/covarF_inv[j,j]
 #---------------------------------------------------------------
-    def getMatrices(self,f):
-        # Slice covarF,covarFB,covarB,meanF,meanB,wF,wB
-        covarF=self.reduceMatrix(self.covar,f,f)
-        meanF=self.reduceMatrix(self.mean,f,[0])
+    def getMatrices(self,covarF_inv,f,w):
+        # Products of the free inverse shared by the gamma/lambda/weight formulas
         b=self.getB(f)
-        covarFB=self.reduceMatrix(self.covar,f,b)
-        wB=self.reduceMatrix(self.w[-1],b,[0])
-        return covarF,covarFB,meanF,wB
+        a1=covarF_inv.sum(axis=1) # covarF_inv.onesF
+        am=np.dot(covarF_inv,self.mean[f,0]) # covarF_inv.meanF
+        if len(b)==0:
+            z,az,wB=np.zeros(len(f)),np.zeros(len(f)),np.zeros(0)
+        else:
+            wB=w[b,0]
+            z=np.dot(self.covar[np.ix_(f,b)],wB) # covarFB.wB
+            az=np.dot(covarF_inv,z)
+        return b,a1,am,z,az,wB
 #---------------------------------------------------------------
-    def getB(self,f):
-        return self.diffLists(range(self.mean.shape[0]),f)
+    def computeW(self,covarF_inv,f,w,meanF):
+        #1) compute gamma
+        b,a1,_,_,az,wB=self.getMatrices(covarF_inv,f,w)
+        am=np.dot(covarF_inv,meanF)
+        g=float((-self.l[-1]*am.sum()+1-wB.sum()+az.sum())/a1.sum())
+        #2) compute weights
+        return -az+g*a1+self.l[-1]*am,g
 #---------------------------------------------------------------
-    def diffLists(self,list1,list2):
-        return list(set(list1)-set(list2))
+    def computeLambdasIn(self,covarF_inv,f,w):
+        # Lambda at which each free weight would hit a bound
+        b,a1,am,z,az,wB=self.getMatrices(covarF_inv,f,w)
+        c1,c3=a1.sum(),am.sum()
+        c=-c1*am+c3*a1
+        bi=np.where(c>0,self.uB[f,0],self.lB[f,0])
+        with np.errstate(divide='ignore',invalid='ignore'):
+            l=((1-wB.sum()+az.sum())*a1-c1*(bi+az))/c
+        l[c==0]=np.nan
+        return l,bi
 #---------------------------------------------------------------
-    def reduceMatrix(self,matrix,listX,listY):
-        # Reduce a matrix to the provided list of rows and columns
-        if len(listX)==0 or len(listY)==0:return
-        matrix_=matrix[:,listY[0]:listY[0]+1]
-        for i in listY[1:]:
-            a=matrix[:,i:i+1]
-            matrix_=np.append(matrix_,a,1)
-        matrix__=matrix_[listX[0]:listX[0]+1,:]
-        for i in listX[1:]:
-            a=matrix_[i:i+1,:]
-            matrix__=np.append(matrix__,a,0)
-        return matrix__
+    def computeLambdasOut(self,covarF_inv,f,b,w):
+        # Lambda at which each bounded weight would enter the free set. Uses the
+        # bordered inverse of covar[f+[i],f+[i]] implicitly: for a vector
+        # v'=[v;v_i], (covarF'_inv.v')[last]=(v_i-u.v)/s with u=covarF_inv.covar[f,i]
+        # and s=covar[i,i]-covar[f,i].u, and sum(covarF'_inv.v') picks up (u.1-1)*(u.v-v_i)/s
+        _,a1,am,z,az,wB=self.getMatrices(covarF_inv,f,w)
+        covarFB=self.covar[np.ix_(f,b)]
+        U=np.dot(covarF_inv,covarFB)
+        s=self.covar[b,b]-(covarFB*U).sum(axis=0)
+        u1=U.sum(axis=0)-1
+        wi=wB
+        zi=np.dot(self.covar[np.ix_(b,b)],wB)-self.covar[b,b]*wi # covar[i,B'].wB'
+        uz=np.dot(z,U)-wi*(self.covar[b,b]-s) # u.(covarFB'.wB')
+        t1=u1/s
+        tm=(np.dot(self.mean[f,0],U)-self.mean[b,0])/s
+        tz=(uz-zi)/s
+        a1_i,am_i,az_i=-t1,-tm,-tz
+        c1=a1.sum()+t1*u1
+        c3=am.sum()+tm*u1
+        l2=az.sum()-wi*(u1+1)+tz*u1
+        l1=wB.sum()-wi
+        c=-c1*am_i+c3*a1_i
+        with np.errstate(divide='ignore',invalid='ignore'):
+            l=((1-l1+l2)*a1_i-c1*(wi+az_i))/c
+        l[c==0]=np.nan
+        return l
+#---------------------------------------------------------------
+    def getB(self,f):
+        return np.setdiff1d(np.arange(self.mean.shape[0]),f)
 #---------------------------------------------------------------
     def purgeNumErr(self,tol):
         # Purge violations of inequality constraints (associated with ill-conditioned covar matrix)
@@ -190,13 +222,26 @@ class CLA:
             else:
                 i+=1
         return
+#---------------------------------------------------------------
+    def purgeDuplicates(self,tol):
+        # Several weights can reach their bounds at one lambda - keep a single turning point for them
+        i=1
+        while i<len(self.w):
+            if np.abs(self.w[i]-self.w[i-1]).max()<=tol:
+                del self.w[i]
+                del self.l[i]
+                del self.g[i]
+                del self.f[i]
+            else:
+                i+=1
+        return
 #---------------------------------------------------------------
     def purgeExcess(self):
         # Remove violations of the convex hull
         i,repeat=0,False
         while True:
             if repeat==False:i+=1
-            if i==len(self.w)-1:break
+            if i>=len(self.w)-1:break
             w=self.w[i]
             mu=np.dot(w.T,self.mean)[0,0]
             j,repeat=i+1,False
@@ -269,18 +314,14 @@ class CLA:
         else:return x2,sign*f2
 #---------------------------------------------------------------
     def efFrontier(self,points):
-        # Get the efficient frontier
-        mu,sigma,weights=[],[],[]
-        a=np.linspace(0,1,points/len(self.w))[:-1] # remove the 1, to avoid duplications
-        b=range(len(self.w)-1)
-        for i in b:
-            w0,w1=self.w[i],self.w[i+1]
-            if i==b[-1]:a=np.linspace(0,1,points/len(self.w)) # include the 1 in the last iteration
-            for j in a:
-                w=w1*j+(1-j)*w0
-                weights.append(np.copy(w))
-                mu.append(np.dot(w.T,self.mean)[0,0])
-                sigma.append(np.dot(np.dot(w.T,self.covar),w)[0,0]**.5)
-        return mu,sigma,weights
+        # Get the efficient frontier - every segment between neighbouring turning points is sampled at once
+        w=np.hstack(self.w).T # turning points x assets
+        if w.shape[0]==1:return [np.dot(w[0],self.mean)[0]],[np.dot(np.dot(w[0],self.covar),w[0])**.5],[np.copy(self.w[0])]
+        a=np.linspace(0,1,points//len(self.w))[:-1] # remove the 1, to avoid duplications
+        weights=w[:-1,None,:]*(1-a)[None,:,None]+w[1:,None,:]*a[None,:,None]
+        weights=np.vstack([weights.reshape(-1,w.shape[1]),w[-1:]]) # include the last turning point
+        mu=np.dot(weights,self.mean)[:,0]
+        sigma=np.einsum('ij,jk,ik->i',weights,self.covar,weights)**.5
+        return list(mu),list(sigma),[x.reshape(-1,1) for x in weights]
 #---------------------------------------------------------------
 #---------------------------------------------------------------
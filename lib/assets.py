@@ -10,24 +10,143 @@ import datetime
 from   dateutil.relativedelta import relativedelta
 
 import pandas           as pd
-import pandas.io.data   as web
 import numpy            as np
-import Quandl
 
+from . import fetch
+from . import inflation
+from . import real_estate
 from . import risk_free_rate
+from . import binary
+from . import price_store
+from . import reverse_optimization
+from . import rolling
+from .ewma import EWMAEstimator
+from . import universe
+from .market_data import MACRO_FACTORS
 
 
 ####################
 # MODULE VARIABLES #
 ####################
 
-monthly_prices = None
+monthly_prices = None # Loaded lazily from the price store - see _monthly_prices()
+tbill_prices   = None
+ewma_estimator = None
+
+HISTORY_START = datetime.date(2000, 1, 1)
+
+# Stored prices this close to the last stored date are fetched again on a
+# refresh, so recently revised adjusted closes are picked up
+REFRESH_OVERLAP = datetime.timedelta(days=14)
+
+# Half life, in months, of the exponentially weighted mean returns / covariances
+EWMA_HALF_LIFE = float(os.environ.get('EWMA_HALF_LIFE', 36))
+
+# Months at the end of the history that the next refresh may recompute (the
+# current, partial month and the refetched overlap) - the saved EWMA estimator
+# stops short of them
+EWMA_REVISABLE_MONTHS = 2
+
+# Market portfolio composition used for the reverse optimized returns. Copied
+# from old spreadsheet, adjusted for tickers.
+# FIXME: These need updating at some point, and on semi-regular basis (1-2x per year?)
+MARKET_PORTFOLIO_WEIGHTS = {
+    "EWC":      0.013,
+    "VFINX":    0.10,
+    "NAESX":    0.018,
+    "EFA":      0.131,
+    "EEM":      0.088,
+    "XSB.TO":   0.013,
+    "XLB":      0.001,
+    "VFISX":    0.034,
+    "VFITX":    0.027,
+    "VUSTX":    0.013,
+    "CSJ":      0.052,
+    "CIU":      0.025,
+    "LQD":      0.070,
+    "BWX":      0.237,
+    "IYR":      0.041,
+    "XRE.TO":   0.005,
+    "RWX":      0.115,
+    "GSG":      0.019,
+}
 
 
 ##############
 # PUBLIC API #
 ##############
 
+def refresh_prices():
+    """
+    Brings the on-disk price store up to date. This is the only place prices are
+    fetched over the network - everything else reads the store.
+
+    Only prices after the last stored date of each ticker (less REFRESH_OVERLAP)
+    are downloaded and merged in, and only the monthly buckets from the first
+    downloaded date onwards are recomputed. Tickers with nothing stored yet get
+    their full history.
+    """
+    global monthly_prices, ewma_estimator
+    tickers = _get_selected_tickers()
+    stored  = price_store.load()
+    stored_monthly = price_store.load_monthly()
+
+    start_dates = {}
+    if stored is not None:
+        for ticker in tickers:
+            if ticker in stored.columns and stored[ticker].notnull().any():
+                start_dates[ticker] = (stored[ticker].last_valid_index() - REFRESH_OVERLAP).date()
+
+    fetched = _get_historical_prices(tickers, start_dates)
+    if len(fetched) == 0 and stored is not None:
+        return
+
+    if stored is None or stored_monthly is None or list(stored_monthly.columns) != tickers:
+        prices  = fetched if stored is None else fetched.combine_first(stored)
+        monthly = _resample_prices(prices[tickers])
+    else:
+        stored, stored_monthly = _rescale_for_revised_adjustments(stored, stored_monthly, fetched)
+        prices  = fetched.combine_first(stored) # Fetched values win in the overlap
+        monthly = _resample_prices_since(prices[tickers], stored_monthly, min(fetched.index))
+
+    price_store.save(prices, monthly)
+    monthly_prices = monthly
+    ewma_estimator = None # Picks up the new months from its checkpoint
+
+def panel_data():
+    """
+    Monthly price/return panel and derived statistics, for lib/panel. Columns
+    and matrices are in asset id order, like everything else stored.
+    :return: (tickers, asset ids, dict of name => numpy array)
+    """
+    assets      = universe.configured()
+    prices      = _monthly_prices()
+    return_sums, product_sums = _return_prefix_sums()
+
+    return (
+        [ assets.ticker_for_id[asset_id] for asset_id in assets.asset_ids ],
+        assets.asset_ids,
+        {
+            'dates':                        prices.index.values.astype('datetime64[ns]'),
+            'monthly_prices':               assets.by_asset_id(prices.values, axes=(1,)),
+            'monthly_returns':              assets.by_asset_id(_monthly_returns().values, axes=(1,)),
+            'mean_returns':                 _mean_returns().values,
+            'five_year_returns':            _five_year_mean_returns().values,
+            'reverse_optimized_returns':    _reverse_optimized_returns().values,
+            'std_dev_returns':              _std_dev_returns().values,
+            'covariance_matrix':            _covariance_matrix().values,
+            'cholesky_decomposition':       _cholesky_decomposition().values,
+            'excess_return_covariance':     _excess_return_covariance().values,
+            'market_portfolio_weights':     _market_portfolio_weights().values,
+            'macro_mean_returns':           _macro_mean_returns().values,
+            'macro_covariance':             _macro_covariance().values,
+            'ewma_returns':                 _ewma_mean_returns().values,
+            'ewma_covariance_matrix':       _ewma_covariance_matrix().values,
+            'return_sums':                  return_sums,
+            'return_product_sums':          product_sums,
+        }
+    )
+
 def asset_json():
     return json.dumps(_formatted_asset_data())
 
@@ -49,6 +168,55 @@ def covariance_matrix_json():
 def cholesky_decomposition_json():
     return _cholesky_decomposition().to_json()
 
+def mean_return_binary():
+    return binary.pack(_mean_returns())
+
+def five_year_mean_return_binary():
+    return binary.pack(_five_year_mean_returns())
+
+def reverse_optimized_returns_binary():
+    return binary.pack(_reverse_optimized_returns())
+
+def std_dev_returns_binary():
+    return binary.pack(_std_dev_returns())
+
+def covariance_matrix_binary():
+    return binary.pack(_covariance_matrix())
+
+def cholesky_decomposition_binary():
+    return binary.pack(_cholesky_decomposition())
+
+def excess_return_covariance_binary():
+    return binary.pack(_excess_return_covariance())
+
+def market_portfolio_weights_binary():
+    return binary.pack(_market_portfolio_weights())
+
+def macro_mean_returns_binary():
+    return binary.pack(_macro_mean_returns())
+
+def macro_covariance_binary():
+    return binary.pack(_macro_covariance())
+
+def ewma_returns_binary():
+    return binary.pack(_ewma_mean_returns())
+
+def ewma_covariance_matrix_binary():
+    return binary.pack(_ewma_covariance_matrix())
+
+def return_sums_binary():
+    # Rows are labelled with their month - see lib/rolling
+    assets          = universe.configured()
+    return_sums, _  = _return_prefix_sums()
+    return binary.pack(pd.DataFrame(return_sums, index=_months(), columns=assets.asset_ids))
+
+def return_product_sums_binary():
+    # Flattened to (months x n*n) - column "a b" holds the sums of a's times b's returns
+    assets          = universe.configured()
+    _, product_sums = _return_prefix_sums()
+    columns         = [ "%s %s" % (a, b) for a in assets.asset_ids for b in assets.asset_ids ]
+    return binary.pack(pd.DataFrame(product_sums.reshape((len(product_sums), -1)), index=_months(), columns=columns))
+
 
 ###############
 # PRIVATE API #
@@ -64,51 +232,102 @@ def _formatted_asset_data():
 
     return {
         "assets": [
-            asset_without_representative_ticker(el) for el in _assets()
+            asset_without_representative_ticker(el) for el in universe.configured().assets
         ]
     }
 
 def _get_selected_tickers():
-    selected_tickers = [ el['representative_ticker'] for el in _assets() ]
-    selected_tickers.sort() # Sort as we are sorting means/covars/etc. Everything needs to be sorted so we treat things in the right order
-    return selected_tickers
+    # Sorted as we are sorting means/covars/etc. Everything needs to be sorted so we treat things in the right order
+    return list(universe.configured().tickers)
+
+def _by_asset_id(stats):
+    """
+    Before we return the data for storage, swap the tickers for asset IDs so that
+    everything outside of this file is **ticker-independent**.
+    :param stats: pandas Series, or square DataFrame, over the selected tickers (sorted)
+    :return: same values, indexed by asset id and in asset id order
+    """
+    assets = universe.configured()
+    if isinstance(stats, pd.DataFrame):
+        return pd.DataFrame(assets.by_asset_id(stats.values, axes=(0, 1)), index=assets.asset_ids, columns=assets.asset_ids)
+    return pd.Series(assets.by_asset_id(stats.values), index=assets.asset_ids)
 
 def _mean_returns():
-    means           = _monthly_returns().mean()
-    means           = means.sort_index()
-    means.index     = _replacement_values_for_tickers()
-    means           = means.sort_index()
-    return means
+    return _by_asset_id(_monthly_returns().mean())
 
 def _five_year_mean_returns():
     today           = datetime.date.today()
     five_years_ago  = ( today - relativedelta(years=5) )
 
     five_year_returns   = _monthly_returns()[five_years_ago:today]
-    means               = five_year_returns.mean()
-    means               = means.sort_index()
-    means.index         = _replacement_values_for_tickers()
-    means               = means.sort_index()
-    return means
+    return _by_asset_id(five_year_returns.mean())
+
+def _return_prefix_sums():
+    """
+    Prefix sums of monthly returns and their cross-products, in asset id order -
+    windowed statistics are computed from these on request (see lib/rolling).
+    """
+    return rolling.prefix_sums(universe.configured().by_asset_id(_monthly_returns().values, axes=(1,)))
+
+def _months():
+    return [ date.strftime('%Y-%m') for date in _monthly_prices().index ]
 
 def _std_dev_returns():
-    stds         = _monthly_returns().std()
-    stds         = stds.sort_index()
-    stds.index   = _replacement_values_for_tickers()
-    stds         = stds.sort_index()
-    return stds
+    return _by_asset_id(_monthly_returns().std())
 
 # def _correlation_matrix():
     # roll_corr = pd.rolling_corr_pairwise(_monthly_returns(), window=5)
     # corr_mat  = _monthly_returns().corr(method='pearson')  # other methods available: 'kendall', 'spearman'
 
 def _covariance_matrix():
-    covs           = _monthly_returns().cov()
-    covs.index     = _replacement_values_for_tickers()
-    covs.columns   = _replacement_values_for_tickers()
-    covs.sort_index(axis=0, inplace=True)
-    covs.sort_index(axis=1, inplace=True)
-    return covs
+    return _by_asset_id(_monthly_returns().cov())
+
+def _ewma_mean_returns():
+    return _by_asset_id(pd.Series(_ewma_estimator().mean, index=_get_selected_tickers()))
+
+def _ewma_covariance_matrix():
+    tickers = _get_selected_tickers()
+    return _by_asset_id(pd.DataFrame(_ewma_estimator().covariance(), index=tickers, columns=tickers))
+
+def _ewma_estimator():
+    """
+    EWMA estimator over every monthly return (in ticker order). It is resumed
+    from the checkpoint saved by the previous update, so only the months added
+    since then are streamed through it. The new checkpoint is taken
+    EWMA_REVISABLE_MONTHS short of the last month. Without a usable
+    checkpoint, all the history is streamed.
+    """
+    global ewma_estimator
+    if ewma_estimator is None:
+        tickers         = _get_selected_tickers()
+        returns         = _monthly_returns().values
+        months          = _months()
+        saved_through   = len(months) - 1 - EWMA_REVISABLE_MONTHS
+
+        checkpoint = price_store.load_checkpoint('ewma')
+        if _ewma_checkpoint_usable(checkpoint, tickers, months[:saved_through + 1]):
+            estimator   = EWMAEstimator.from_state(checkpoint)
+            start       = months.index(str(checkpoint['month'])) + 1
+        else:
+            estimator   = EWMAEstimator(EWMA_HALF_LIFE, len(tickers))
+            start       = 1 # The first month has no return
+
+        for row in range(start, len(months)):
+            estimator.update(returns[row])
+            if row == saved_through:
+                state = estimator.state()
+                state.update(month=np.array(months[row]), tickers=np.array([ u'%s' % ticker for ticker in tickers ]))
+                price_store.save_checkpoint('ewma', state)
+        ewma_estimator = estimator
+    return ewma_estimator
+
+def _ewma_checkpoint_usable(checkpoint, tickers, months):
+    return (
+        checkpoint is not None and
+        list(checkpoint['tickers']) == list(tickers) and
+        float(checkpoint['half_life']) == EWMA_HALF_LIFE and
+        str(checkpoint['month']) in months
+    )
 
 def _cholesky_decomposition():
     covars              = _covariance_matrix()
@@ -117,47 +336,66 @@ def _cholesky_decomposition():
     cholesky.columns    = covars.columns
     return cholesky
 
-def _replacement_values_for_tickers():
-    # Before we return the data for storage, swap the tickers for asset IDs so that
-    # everything outside of this file is **ticker-independent**
-    # _get_selected_tickers() is sorted
-    assets_list = _assets()
-    replacement_values = []
-    for ticker in _get_selected_tickers():
-        relevant_asset_dict_index = next(index for (index, d) in enumerate(assets_list) if d['representative_ticker'] == ticker)
-        asset_dict = assets_list[relevant_asset_dict_index]
-        replacement_values.append(asset_dict['id'])
-    return replacement_values
-
-def _get_historical_prices(tickers):
-    """
-    Obtains resampled historical adjusted close prices for tickers.
+def _macro_returns():
+    """
+    :return: pandas DataFrame of monthly inflation and real estate returns (MACRO_FACTORS columns)
+    """
+    macro = pd.concat([ inflation.monthly_returns(), real_estate.monthly_returns() ], axis=1)
+    macro.columns = list(MACRO_FACTORS)
+    return macro
+
+def _macro_mean_returns():
+    # Same values as served on /inflation and /real_estate
+    return _macro_returns().mean()
+
+def _macro_covariance():
+    """
+    Covariances of asset and inflation / real estate returns with inflation and
+    real estate returns, over the months all of them have data - lets those be
+    simulated jointly with a portfolio.
+    :return: pandas DataFrame - rows are asset ids followed by MACRO_FACTORS, columns are MACRO_FACTORS
+    """
+    # Month end dates of the two sources do not always line up - join on the month
+    returns         = _monthly_returns()
+    returns.index   = returns.index.to_period('M')
+    macro           = _macro_returns()
+    macro.index     = macro.index.to_period('M')
+    joined          = pd.concat([ returns, macro ], axis=1, join='inner')
+
+    covs            = joined.cov()[list(MACRO_FACTORS)].values
+    asset_count     = len(returns.columns)
+    assets          = universe.configured()
+    return pd.DataFrame(
+        np.vstack([ assets.by_asset_id(covs[:asset_count]), covs[asset_count:] ]),
+        index   = assets.asset_ids + list(MACRO_FACTORS),
+        columns = list(MACRO_FACTORS)
+    )
+
+def _get_historical_prices(tickers, start_dates=None):
+    """
+    Obtains daily historical adjusted close prices for tickers.
     :param tickers: list of tickers as strings
-    :return: pandas DataFrame of asset prices
+    :param start_dates: optional dict of ticker => first date to fetch (defaults to HISTORY_START)
+    :return: pandas DataFrame of asset prices - outer joined, so may contain NaNs
     """
     # Defaults (not going to add complexity to args list)
     use_adjusted        = True
-    resample_monthly    = True
-    start               = datetime.datetime(2000, 1, 1).date()
     end                 = datetime.date.today()
-    data_source         = 'yahoo' # 'google'
+    start_dates         = start_dates or {}
 
     def getWebTickerData(ticker):
         """
         :param ticker: string, Yahoo finance ticker
         :return: pandas DataFrame of ticker Close data
         """
-        return web.DataReader(ticker, data_source, start, end)
+        return fetch.yahoo_prices(ticker, start_dates.get(ticker, HISTORY_START), end)
 
-    # def getQuandlTickerData(ticker):
-        # authtoken = os.getenv('QUANDL_TOKEN', '')
-        # data = Quandl.get(ticker, authtoken=authtoken, transformation=transformation)
-        # return data
+    # Fetched concurrently - the time is all spent waiting on the network
+    ticker_data = fetch.run_concurrently(getWebTickerData, tickers)
 
     df = pd.DataFrame()
 
-    for ticker in tickers:
-        data = getWebTickerData(ticker)
+    for ticker, data in zip(tickers, ticker_data):
         if use_adjusted:
             if 'Adjusted Close' in data.columns:
                 data = data[['Adjusted Close']]
@@ -168,6 +406,60 @@ def _get_historical_prices(tickers):
         data.columns = [ticker]
         df = pd.merge(df, data, left_index=True, right_index=True, how='outer')
 
+    return df
+
+def _resample_prices(df):
+    """
+    Aligns daily prices across tickers and resamples them to monthly means.
+    :param df: pandas DataFrame of daily prices, as returned by _get_historical_prices
+    :return: pandas DataFrame of monthly asset prices
+    """
+    return _resample_monthly(_align_prices(df))
+
+def _resample_prices_since(df, monthly, since):
+    """
+    Same result as _resample_prices(df), but only the monthly buckets from the
+    month containing `since` onwards are recomputed - earlier months are kept
+    from `monthly`.
+    """
+    month_start = pd.Timestamp(datetime.date(since.year, since.month, 1))
+
+    # Interpolation only looks at the nearest valid prices, so aligning from the
+    # last complete row before the recomputed months gives the same values as
+    # aligning the whole history
+    complete = df[df.index < month_start].dropna()
+    anchor   = complete.index[-1] if len(complete) > 0 else df.index[0]
+
+    recomputed = _resample_monthly(_align_prices(df[anchor:]))
+    recomputed = recomputed[recomputed.index >= month_start]
+    return pd.concat([ monthly[monthly.index < month_start], recomputed ])
+
+def _rescale_for_revised_adjustments(stored, stored_monthly, fetched):
+    """
+    A dividend or split rescales a ticker's whole adjusted close history. When
+    the overlap shows a ticker's fetched prices at a constant ratio to the stored
+    ones, the stored daily and monthly history is rescaled by that ratio (monthly
+    means and linear interpolation scale with it, so nothing is recomputed).
+    """
+    stored, stored_monthly = stored.copy(), stored_monthly.copy()
+    for ticker in fetched.columns:
+        if ticker not in stored.columns:
+            continue
+        overlap = pd.concat([ fetched[ticker], stored[ticker] ], axis=1, join='inner').dropna()
+        if len(overlap) == 0:
+            continue
+        ratio = (overlap.iloc[:, 0] / overlap.iloc[:, 1]).median()
+        if abs(ratio - 1) > 1e-9:
+            stored[ticker] *= ratio
+            if ticker in stored_monthly.columns:
+                stored_monthly[ticker] *= ratio
+    return stored, stored_monthly
+
+def _align_prices(df):
+    """
+    :param df: pandas DataFrame of daily prices, as returned by _get_historical_prices
+    :return: daily prices over the period where all tickers have data
+    """
     # Fill missing values by linear interpolation
     df = df.interpolate()
 
@@ -177,6 +469,11 @@ def _get_historical_prices(tickers):
     # the same time period.
     df = df.dropna()
 
+    return df
+
+def _resample_monthly(df):
+    resample_monthly = True
+
     # Resample to monthly:
     # - We only have monthly data for real estate index (for simulation - not ETFs)
     # - Monthly mean/variance is statistically more relevant for long-term investors (smooths short-term volatility)
@@ -193,128 +490,70 @@ def _get_tbill(trim_start="2000-01-31"):
     be assumed to be a good proxy for the "Risk Free Rate"
     :return: pandas DataFrame of TBill data
     """
-    df = Quandl.get("WREN/W10", trim_start=trim_start, collapse="monthly")
-    return df['Value']
+    global tbill_prices
+    if tbill_prices is None:
+        # Memoized - the reverse optimized returns are computed once per output format
+        tbill_prices = fetch.quandl("WREN/W10", trim_start=trim_start, collapse="monthly")['Value']
+    return tbill_prices
 
-def _reverse_optimized_returns():
+def _excess_return_covariance():
+    """
+    Covariance matrix of historical monthly returns in excess of the T-Bill
+    return - the price dependent part of the reverse portfolio optimization.
+    :return: pandas DataFrame indexed by asset id on both axes
     """
-    Performs a reverse portfolio optimization. First section pulls required data
-    together, second section executes.
-    """
-
-    monthly_risk_free_rate      = risk_free_rate.monthly_risk_free_rate()
-    monthly_market_risk_premium = risk_free_rate.monthly_market_risk_premium()
-
-    # Copied from old spreadsheet, adjusted for tickers
-    # FIXME: These need updating at some point, and on semi-regular basis (1-2x per year?)
-    market_portfolio_weights = pd.Series({
-        "EWC":      0.013,
-        "VFINX":    0.10,
-        "NAESX":    0.018,
-        "EFA":      0.131,
-        "EEM":      0.088,
-        "XSB.TO":   0.013,
-        "XLB":      0.001,
-        "VFISX":    0.034,
-        "VFITX":    0.027,
-        "VUSTX":    0.013,
-        "CSJ":      0.052,
-        "CIU":      0.025,
-        "LQD":      0.070,
-        "BWX":      0.237,
-        "IYR":      0.041,
-        "XRE.TO":   0.005,
-        "RWX":      0.115,
-        "GSG":      0.019,
-    })
-
     historical_risk_free_returns = _get_tbill().pct_change()
 
     # Cut prices off at end of tbills - tbills has less data
-    relevant_prices = _monthly_returns()[:historical_risk_free_returns.tail(1).index[0]]
+    relevant_returns = _monthly_returns()[:historical_risk_free_returns.tail(1).index[0]]
 
-    # Start tbills at same start date as prices
+    # Start tbills at same start date as prices. The two are matched up by
+    # position (month n of returns with month n of tbills), not by date.
     relevant_historical_returns = historical_risk_free_returns[_monthly_returns()[0:1].index[0]:]
+    risk_free_values = relevant_historical_returns.values[:len(relevant_returns)]
 
-    def reverse_portfolio_optimization(
-        historical_return_data,
-        historical_risk_free_returns,
-        market_portfolio_weights,
-        market_risk_premium,
-        current_risk_free_rate):
-        """
-        Returns "market equilibrium" expected returns for a set of assets, based on
-        the Black-Litterman Reverse Portfolio Optimization method.
-        :param historical_return_data: pandas DataFrame of historical RETURNS (i.e. not prices) for the set of assets
-        :param historical_risk_free_returns: pandas Series of historical RFR for the matching period
-        :param market_portfolio_weights: pandas Series of market portfolio composition weights
-        :param market_risk_premium: estimation of the current market risk premium
-        :param current_risk_free_rate: estimation of the current risk-free rate
-
-        :return: reverse_optimized_returns: pandas series of market equil. returns
-        """
-
-        historical_return_data.sort()
-        historical_mean_returns = historical_return_data.mean()
-        historical_covariances = historical_return_data.cov()
-        market_portfolio_weights.sort_index()
-
-        ## 1: Convert to excess returns ##
-        excess_returns = {}
-        for asset, historical_returns in historical_return_data.iteritems():
-            excess_returns[asset] = [ (ret - historical_risk_free_returns[index] + current_risk_free_rate) for index, ret in enumerate(historical_returns) ]
-        excess_returns = pd.DataFrame(excess_returns)
-
-        ## 2: Get covariances ##
-        excess_return_covariances = excess_returns.cov()
-
-        ## 3: Get beta ##
-        # A) Covariance of assets with mkt portfolio
-        covariances = {}
-        for asset in excess_return_covariances:
-            covars = excess_return_covariances[asset]
-            covariances[asset] = np.dot(market_portfolio_weights, covars)
-        covariances = pd.Series(covariances)
-
-        # B) Variance of mkt portfolio
-        var_mkt_port = np.dot(covariances, market_portfolio_weights)
-
-        # c) Calculate Betas
-        betas = covariances / var_mkt_port
-
-        ## 4: Calculate returns via beta ##
-        reverse_optimized_returns = betas * market_risk_premium + current_risk_free_rate
-
-        return reverse_optimized_returns
+    # Adding back the current risk free rate (as the excess returns used to be
+    # defined) shifts every return by a constant, which leaves the covariance
+    # unchanged - so it is left out.
+    excess_returns = relevant_returns.sub(risk_free_values, axis=0)
 
-    optimized_returns = reverse_portfolio_optimization(
-        relevant_prices,
-        relevant_historical_returns,
-        market_portfolio_weights,
-        monthly_market_risk_premium,
-        monthly_risk_free_rate)
+    return _by_asset_id(excess_returns.cov())
 
-    optimized_returns           = optimized_returns.sort_index()
-    optimized_returns.index     = _replacement_values_for_tickers()
-    optimized_returns           = optimized_returns.sort_index()
-
-    return optimized_returns
-
-def _assets():
-    this_dir = os.path.dirname(__file__)
-    json_dir = os.path.join(this_dir, os.pardir, 'config')
-    etfs_file_path = os.path.join(json_dir, 'assets.json')
+def _market_portfolio_weights():
+    """
+    :return: pandas Series of MARKET_PORTFOLIO_WEIGHTS indexed by asset id
+    """
+    return _by_asset_id(pd.Series(MARKET_PORTFOLIO_WEIGHTS).reindex(_get_selected_tickers()).fillna(0.0))
 
-    with open(etfs_file_path) as data_file:
-        assets_list = json.load(data_file)
-    return assets_list
+def _reverse_optimized_returns():
+    """
+    Performs a reverse portfolio optimization against the stored market
+    portfolio weights and the current risk free rate / market risk premium.
+    """
+    covars  = _excess_return_covariance()
+    weights = _market_portfolio_weights()
+
+    optimized_returns = reverse_optimization.implied_returns(
+        covars.values,
+        weights.values,
+        risk_free_rate.monthly_market_risk_premium(),
+        risk_free_rate.monthly_risk_free_rate())
+
+    return pd.Series(optimized_returns, index=covars.index)
+
+def _monthly_prices():
+    # Importing this module does no I/O - prices are read from the on-disk store
+    # on first use (refresh_prices() fills the store from the network)
+    global monthly_prices
+    if monthly_prices is None:
+        daily_prices = price_store.load()
+        if daily_prices is None:
+            raise IOError("No stored prices at %s - run refresh_prices() first" % price_store.path())
+        tickers = _get_selected_tickers()
+        monthly_prices = price_store.load_monthly()
+        if monthly_prices is None or list(monthly_prices.columns) != tickers:
+            monthly_prices = _resample_prices(daily_prices[tickers]) # Default option resamples the prices as monthly means
+    return monthly_prices
 
 def _monthly_returns():
-    return monthly_prices.pct_change()
-
-
-#########
-# SETUP #
-#########
-
-monthly_prices = _get_historical_prices(_get_selected_tickers()) # Default option resamples the prices as monthly means
+    return _monthly_prices().pct_change()
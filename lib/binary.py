@@ -0,0 +1,85 @@
+###########
+# IMPORTS #
+###########
+
+from __future__ import absolute_import
+
+import struct
+
+import numpy  as np
+import pandas as pd
+
+
+####################
+# MODULE VARIABLES #
+####################
+
+# Layout of a packed value:
+#   header  - magic, version, ndim, (padding), rows, columns, length of labels
+#   labels  - utf-8 asset ids separated by newlines. Row labels, followed by
+#             the column labels for 2-d values.
+#   padding - zero bytes so the data starts on an 8 byte boundary
+#   data    - rows * columns little-endian float64 values in C order
+MAGIC           = b'RPF8'
+VERSION         = 1
+HEADER          = struct.Struct('<4sBBHIII')
+DTYPE           = np.dtype('<f8')
+LABEL_SEPARATOR = u'\n'
+
+
+##############
+# PUBLIC API #
+##############
+
+def pack(data):
+    """
+    Packs a pandas Series or DataFrame of floats into the binary format.
+    :param data: pandas Series or DataFrame
+    :return: byte string
+    """
+    if isinstance(data, pd.DataFrame):
+        labels = list(data.index) + list(data.columns)
+        rows, columns = data.shape
+        ndim = 2
+    else:
+        labels = list(data.index)
+        rows, columns = len(data), 1
+        ndim = 1
+
+    encoded_labels  = LABEL_SEPARATOR.join(u'%s' % label for label in labels).encode('utf-8')
+    header          = HEADER.pack(MAGIC, VERSION, ndim, 0, rows, columns, len(encoded_labels))
+    padding         = b'\0' * (-(HEADER.size + len(encoded_labels)) % DTYPE.itemsize)
+    values          = np.ascontiguousarray(data.values, dtype=DTYPE)
+
+    return header + encoded_labels + padding + bytes(values.data) # Not tostring() / tobytes() - each is missing from one of the numpy versions we run
+
+def unpack_array(packed):
+    """
+    Reads a packed value without copying the numeric data - the returned array is
+    a read-only view over `packed`.
+    :param packed: byte string produced by pack()
+    :return: (row labels, column labels or None, numpy array)
+    """
+    magic, version, ndim, _, rows, columns, labels_length = HEADER.unpack_from(packed)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Unrecognized packed data (magic %r, version %r)" % (magic, version))
+
+    labels  = packed[HEADER.size:HEADER.size + labels_length].decode('utf-8').split(LABEL_SEPARATOR)
+    offset  = HEADER.size + labels_length
+    offset += -offset % DTYPE.itemsize
+    values  = np.frombuffer(packed, dtype=DTYPE, count=rows * columns, offset=offset)
+
+    if ndim == 2:
+        return labels[:rows], labels[rows:], values.reshape((rows, columns))
+    return labels, None, values
+
+def unpack(packed):
+    """
+    Reads a packed value back into a pandas Series or DataFrame backed by the
+    packed buffer.
+    :param packed: byte string produced by pack()
+    """
+    index, columns, values = unpack_array(packed)
+    if columns is None:
+        return pd.Series(values, index=index)
+    return pd.DataFrame(values, index=index, columns=columns, copy=False)
@@ -5,7 +5,32 @@
 from __future__ import absolute_import
 
 import os
+import time
+import uuid
+import threading
+import collections
 import requests
+import bmemcached
+
+
+####################
+# MODULE VARIABLES #
+####################
+
+# Entries kept in each worker's LRU in front of memcached
+LOCAL_CACHE_SIZE = int(os.environ.get('LOCAL_CACHE_SIZE', 256))
+
+# Gunicorn kills a worker whose request takes longer than this - see bin/web
+WORKER_TIMEOUT = int(os.environ.get('WEB_TIMEOUT', 30))
+
+# A worker building a missing value holds "<key>/building" in memcached. The
+# lock expires after BUILD_LOCK_TTL seconds in case its holder dies - it can not
+# build for longer than a request may take. Others poll for the value every
+# BUILD_POLL_INTERVAL seconds and build it themselves after BUILD_WAIT seconds,
+# early enough to still finish before they are killed.
+BUILD_LOCK_TTL      = WORKER_TIMEOUT
+BUILD_POLL_INTERVAL = 0.05
+BUILD_WAIT          = WORKER_TIMEOUT / 3.0
 
 
 ##############
@@ -16,6 +41,95 @@ def clear():
     requests.get( _cache_url() , headers={'Authorization': _auth_token()} )
     return True
 
+def client():
+    # Same memcached the server uses - local in development
+    if os.environ.get('DEBUG', False):
+        return bmemcached.Client(servers=['127.0.0.1:11211'])
+    return bmemcached.Client(
+                servers=os.environ['MEMCACHEDCLOUD_SERVERS'].split(","),
+                username=os.environ['MEMCACHEDCLOUD_USERNAME'],
+                password=os.environ['MEMCACHEDCLOUD_PASSWORD']
+            )
+
+def versioned_key(key, generation):
+    # Memcached key of key's value built from the given data generation
+    return "%s@%d" % (key, generation)
+
+class TieredCache(object):
+    """
+    Size-bounded LRU in this worker in front of the shared memcached. Values
+    are stored under their data generation (see versioned_key), so a value
+    built from one generation's data is never served for another - whether or
+    not memcached has been flushed since the generation was bumped.
+    Thread-safe - frontier jobs store their results from the process pool's
+    result thread, and neither the LRU nor the memcached client are.
+    """
+
+    def __init__(self, remote, size=LOCAL_CACHE_SIZE):
+        """
+        :param remote: memcached client, see client()
+        :param size: maximum number of local entries
+        """
+        self.remote = remote
+        self.size   = size
+        self._local = collections.OrderedDict()
+        self._lock  = threading.RLock()
+
+    def get(self, key, generation):
+        key = versioned_key(key, generation)
+        with self._lock:
+            value = self._local.pop(key, None)
+            if value is not None:
+                self._local[key] = value # Most recently used last
+                return value
+            value = self.remote.get(key)
+            if value is not None:
+                self._remember(key, value)
+            return value
+
+    def set(self, key, value, generation):
+        key = versioned_key(key, generation)
+        with self._lock:
+            self.remote.set(key, value)
+            self._remember(key, value)
+
+    def get_or_build(self, key, build, generation):
+        """
+        Cached value of key - on a miss only one worker at a time calls build()
+        for it, the others wait for its result.
+        :param build: function returning the value to cache, built from the given generation's data
+        """
+        value = self.get(key, generation)
+        deadline = time.time() + BUILD_WAIT
+        lock_key, token = versioned_key(key, generation) + "/building", uuid.uuid4().hex
+
+        while value is None:
+            with self._lock:
+                locked = self.remote.add(lock_key, token, time=BUILD_LOCK_TTL)
+            if locked or time.time() > deadline:
+                try:
+                    value = build()
+                    self.set(key, value, generation)
+                finally:
+                    with self._lock:
+                        if self.remote.get(lock_key) == token:
+                            self.remote.delete(lock_key)
+                return value
+            time.sleep(BUILD_POLL_INTERVAL)
+            value = self.get(key, generation)
+        return value
+
+    def flush_all(self):
+        with self._lock:
+            self._local.clear()
+            return self.remote.flush_all()
+
+    def _remember(self, key, value):
+        self._local.pop(key, None)
+        self._local[key] = value
+        while len(self._local) > self.size:
+            self._local.popitem(last=False)
+
 
 ###############
 # PRIVATE API #
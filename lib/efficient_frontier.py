@@ -5,24 +5,35 @@
 from __future__ import absolute_import
 
 import math
+import numpy as np
 from numpy import linspace, ones, dot, array
 import scipy, scipy.optimize
 
 from . import risk_free_rate
+from .CLA import CLA
 
 
 ####################
 # MODULE VARIABLES #
 ####################
 
-NUMBER_PORTFOLIOS_TO_GENERATE = 20
+NUMBER_PORTFOLIOS_TO_GENERATE = 20 # Default - callers can ask for MIN_POINTS to MAX_POINTS
+MIN_POINTS = 10
+MAX_POINTS = 1000
+
+# 'slsqp' - one SLSQP solve per target return
+# 'cla'   - exact turning points from the Critical Line Algorithm, interpolated
+METHODS = ('slsqp', 'cla')
+
+# Constraint violation up to which an SLSQP result that did not converge is still used
+FEASIBILITY_TOLERANCE = 1e-8
 
 
 ##############
 # PUBLIC API #
 ##############
 
-def efficient_frontier(asset_ids, asset_returns, historical_returns, covariance_matrix):
+def efficient_frontier(asset_ids, asset_returns, historical_returns, covariance_matrix, method='slsqp', points=NUMBER_PORTFOLIOS_TO_GENERATE):
     """
     Generates and formats an efficient frontier for a given set of asset ids,
     and their corresponding mean returns and covariances. ID's and the columns/indexes of means/covars are expected to match.
@@ -30,19 +41,110 @@ def efficient_frontier(asset_ids, asset_returns, historical_returns, covariance_
     :param asset_returns: numpy array of the relevant returns corresponding to passed in asset_ids - typically the market implied returns
     :param historical_returns: numpy array of the historical mean returns corresponding to passed in asset_ids
     :param covariance_matrix: numpy matrix of the covariances corresponding to passed in asset_ids
+    :param method: frontier solver - one of METHODS
+    :param points: number of target returns to solve for, MIN_POINTS to MAX_POINTS. 'cla' costs
+    the same at any resolution, 'slsqp' solves once per point.
     """
+    if method not in METHODS:
+        raise ValueError("Unknown efficient frontier method: %s" % method)
+    if not MIN_POINTS <= points <= MAX_POINTS:
+        raise ValueError("Frontier points must be between %d and %d" % (MIN_POINTS, MAX_POINTS))
 
     # Generate the frontier
-    rfr      = risk_free_rate.monthly_risk_free_rate()
-    frontier = _solve_frontier(asset_returns, covariance_matrix, rfr)
+    if method == 'cla':
+        frontier = _cla_frontier(asset_returns, covariance_matrix, points)
+    else:
+        rfr      = risk_free_rate.monthly_risk_free_rate()
+        frontier = _solve_frontier(asset_returns, covariance_matrix, rfr, points)
+
+    # Sort & cull
+    culled = _sort_and_cull_frontier(frontier)
 
     # Format the frontier, pass in the historical returns so that historical portfolio returns can be calculated
-    formatted = _format_frontier(frontier, asset_ids, historical_returns)
+    return { "portfolios": _format_frontier(culled, asset_ids, historical_returns) }
 
-    # Sort & cull
-    culled = _sort_and_cull_frontier(formatted)
+def optimal_portfolios(asset_ids, asset_returns, historical_returns, covariance_matrix):
+    """
+    The maximum Sharpe ratio (tangency) and global minimum variance portfolios
+    of the long-only, fully invested frontier - both exact, from the CLA
+    turning points. Arguments as for efficient_frontier().
+    """
+    rfr     = risk_free_rate.monthly_risk_free_rate()
+    covar   = np.asarray(covariance_matrix, dtype=float)
+    turning_means, turning_weights = _cla_turning_points(asset_returns, covariance_matrix)
+    turning_vars = np.einsum('ij,jk,ik->i', turning_weights, covar, turning_weights)
 
-    return { "portfolios": culled }
+    # The frontier's variance only falls until its minimum variance end, which
+    # is a turning point
+    min_variance    = turning_weights[np.argmin(turning_vars)]
+    max_sharpe      = _max_sharpe_weights(turning_means, turning_weights, covar, rfr)
+
+    weights     = np.array([ max_sharpe, min_variance ])
+    means       = weights.dot(np.asarray(asset_returns, dtype=float))
+    variances   = np.einsum('ij,jk,ik->i', weights, covar, weights)
+    max_sharpe_formatted, min_variance_formatted = _format_frontier((means, variances, weights), asset_ids, historical_returns)
+    max_sharpe_formatted['statistics']['sharpe_ratio'] = (means[0] - rfr) / math.sqrt(variances[0])
+
+    return { "max_sharpe": max_sharpe_formatted, "min_variance": min_variance_formatted }
+
+def turning_points(asset_returns, covariance_matrix):
+    """
+    CLA turning points of the long-only, fully invested frontier, for caching
+    and later lookups with frontier_portfolio().
+    :return: {"means": [...], "weights": [[...], ...]} ordered by increasing mean
+    """
+    means, weights = _cla_turning_points(asset_returns, covariance_matrix)
+    return { "means": means.tolist(), "weights": weights.tolist() }
+
+def frontier_portfolio(asset_ids, cached_turning_points, historical_returns, covariance_matrix, annual_std_dev=None, annual_return=None):
+    """
+    The exact frontier portfolio with the given annual std dev or annual return.
+    Mean and variance both increase from one turning point to the next, so the
+    target is binary searched among the turning points and solved for on its
+    segment - linear in the return, quadratic in the variance. Targets beyond
+    the ends of the frontier get the end portfolio.
+    :param cached_turning_points: as returned by turning_points()
+    :param annual_std_dev: target annual std dev - or
+    :param annual_return: target annual nominal return
+    :return: portfolio formatted like the frontier's
+    """
+    covar   = np.asarray(covariance_matrix, dtype=float)
+    means   = np.asarray(cached_turning_points["means"], dtype=float)
+    weights = np.asarray(cached_turning_points["weights"], dtype=float)
+
+    if annual_std_dev is not None:
+        values = np.einsum('ij,jk,ik->i', weights, covar, weights)
+        target = (annual_std_dev / math.sqrt(12)) ** 2
+    else:
+        values = means
+        target = math.pow(1 + annual_return, 1.0 / 12.0) - 1
+
+    upper = int(np.searchsorted(values, target))
+    if upper == 0 or len(values) == 1:
+        t, upper = 0.0, 1
+    elif upper == len(values):
+        t, upper = 1.0, len(values) - 1
+    elif annual_std_dev is not None:
+        # a + 2bt + ct^2 = target, for the root in [0, 1]
+        start       = weights[upper - 1]
+        direction   = weights[upper] - start
+        a           = values[upper - 1]
+        b           = start.dot(covar).dot(direction)
+        c           = direction.dot(covar).dot(direction)
+        t           = (-b + math.sqrt(max(b * b - c * (a - target), 0))) / c if c > 0 else (target - a) / (2 * b)
+    else:
+        t = (target - means[upper - 1]) / (means[upper] - means[upper - 1])
+    t = min(max(t, 0.0), 1.0)
+
+    if len(values) == 1:
+        portfolio, mean = weights[0], means[0]
+    else:
+        # Mean return is linear in the weights too
+        portfolio   = weights[upper - 1] + t * (weights[upper] - weights[upper - 1])
+        mean        = means[upper - 1] + t * (means[upper] - means[upper - 1])
+
+    variance = portfolio.dot(covar).dot(portfolio)
+    return _format_frontier((np.array([ mean ]), np.array([ variance ]), np.array([ portfolio ])), asset_ids, historical_returns)[0]
 
 
 ###############
@@ -50,45 +152,49 @@ def efficient_frontier(asset_ids, asset_returns, historical_returns, covariance_
 ###############
 
 def _sort_and_cull_frontier(frontier):
-    # Frontier needs to be sorted by increasing level of risk prior to cull algorithm
-    frontier.sort(key=lambda elem: elem['statistics']['std_dev'] )
-
-    culled_frontier = []
-    last_return = -999999
-
-    for portfolio in frontier:
-        if portfolio['statistics']['mean_return'] > last_return:
-            last_return = portfolio['statistics']['mean_return']
-            culled_frontier.append(portfolio)
-
-    return culled_frontier
+    """
+    Sorts the frontier by increasing level of risk and keeps only the portfolios
+    whose mean return beats every less risky portfolio.
+    :param frontier: (means, variances, weights) arrays
+    :return: (means, variances, weights) of the kept portfolios, in order of risk
+    """
+    means, variances, weights = [ np.asarray(values, dtype=float) for values in frontier ]
+    order           = np.argsort(variances, kind='mergesort')
+    sorted_means    = means[order]
+    best_before     = np.concatenate([ [-np.inf], np.maximum.accumulate(sorted_means)[:-1] ])
+    keep            = order[sorted_means > best_before]
+    return means[keep], variances[keep], weights[keep]
 
 def _format_frontier(frontier, asset_ids, historical_returns):
-    frontier_means      = frontier[0]
-    frontier_variances  = frontier[1]
-    frontier_weights    = frontier[2]
-    formatted_frontier  = []
-    for index, portfolio_allocation in enumerate(frontier_weights):
-        rounded_portfolio_allocation    = [round(asset_weight, 4) for asset_weight in portfolio_allocation]
-        this_portfolios_mean            = frontier_means[index]
-        this_portfolios_std_dev         = math.pow(frontier_variances[index], 0.5)
-        formatted_frontier.append({
+    frontier_means, frontier_variances, frontier_weights = [ np.asarray(values, dtype=float) for values in frontier ]
+    statistics = zip(
+        frontier_means.tolist(),
+        np.sqrt(frontier_variances).tolist(),
+        _annual_nominal_return(frontier_means).tolist(),
+        _annual_std_dev(np.sqrt(frontier_variances)).tolist(),
+        _annual_nominal_return(frontier_weights.dot(np.asarray(historical_returns, dtype=float))).tolist()
+    )
+    return [
+        {
             "allocation": dict(zip(asset_ids, rounded_portfolio_allocation)),
             "statistics": {
-                "mean_return":              this_portfolios_mean,
-                "std_dev":                  this_portfolios_std_dev,
-                "annual_nominal_return":    _annual_nominal_return(this_portfolios_mean),
-                "annual_std_dev":           _annual_std_dev(this_portfolios_std_dev),
-                "annual_alternate_return":  _annual_nominal_return(_port_mean(portfolio_allocation, historical_returns))
+                "mean_return":              mean_return,
+                "std_dev":                  std_dev,
+                "annual_nominal_return":    annual_nominal_return,
+                "annual_std_dev":           annual_std_dev,
+                "annual_alternate_return":  annual_alternate_return
             }
-        })
-    return formatted_frontier
+        }
+        for rounded_portfolio_allocation, (mean_return, std_dev, annual_nominal_return, annual_std_dev, annual_alternate_return)
+        in zip(np.round(frontier_weights, 4).tolist(), statistics)
+    ]
 
 def _annual_nominal_return(monthly_mean_return, nominal=True):
     """
     Converts a monthly mean return (nominal default) to an annualized nominal return
+    - a float, or a numpy array of them
     """
-    annualized = math.pow((1 + monthly_mean_return), 12) - 1
+    annualized = (1 + monthly_mean_return) ** 12 - 1
     if not nominal:
         annualized += 0.02 # Assume 2% inflation ## This is NOT getting called by default
     return annualized
@@ -125,33 +231,159 @@ def _port_mean_var(weights, means, covars):
     """
     return _port_mean(weights, means), _port_var(weights, covars)
 
-def _solve_frontier(R, C, rf):
+def _solve_frontier(R, C, rf, points=NUMBER_PORTFOLIOS_TO_GENERATE):
     """
     Given risk-free rate, assets returns and covariances, this function calculates
     mean-variance frontier and returns its [x,y] points in two arrays.
     Source: https://code.google.com/p/quantandfinancial/ GNU GPL v3
-    Not modified except for underscores in front of method names.
+    Modified to pass analytic gradients to SLSQP, to enforce the target return as
+    an equality constraint rather than a penalty, to start each target from
+    the previous target's optimum, and to solve a rescaled problem.
     :param R: numpy array of asset mean returns
     :param C: numpy array of asset covariances
     :param rf: risk-free rate
+    :param points: number of target returns
     """
-    def fitness(W, R, C, r):
-        # For given level of return r, find weights which minimizes portfolio variance.
-        mean, var = _port_mean_var(W, R, C)
-        # Big penalty for not meeting stated portfolio return effectively serves as optimization constraint
-        penalty = 50*abs(mean-r)
-        return var + penalty
+    R = array(R, dtype=float)
+    C = array(C, dtype=float)
+
+    # Monthly variances and returns are ~1e-4 and ~1e-2, far below SLSQP's
+    # tolerances - solve with the covariances scaled to an average variance of
+    # one and the return constraint scaled to the spread of returns
+    n               = len(R) # Number of assets in the portfolio
+    variance_scale  = C.trace() / n if C.trace() > 0 else 1.
+    return_scale    = R.max() - R.min() if R.max() > R.min() else 1.
+    C_scaled        = C / variance_scale
+
+    def fitness(W, C):
+        # For given level of return r (constraint), find weights which minimizes portfolio variance.
+        return _port_var(W, C)
+    def fitness_gradient(W, C):
+        return 2 * dot(C, W)
+    def total_weight(W):
+        return W.sum() - 1.
+    def total_weight_gradient(W):
+        return ones([n])
+    def target_return(W, r):
+        return (dot(W, R) - r) / return_scale
+    def target_return_gradient(W, r):
+        return R / return_scale
+    def minimize(W, r):
+        c_ = (
+            {'type':'eq', 'fun': total_weight,   'jac': total_weight_gradient},
+            {'type':'eq', 'fun': target_return,  'jac': target_return_gradient, 'args': (r,)},
+        )
+        return scipy.optimize.minimize(fitness, W, (C_scaled,), jac=fitness_gradient, method='SLSQP', constraints=c_, bounds=b_, options=o_)
+    def usable(optimized, r):
+        # SLSQP can stop short of its tolerance (iteration limit, failed line
+        # search) at a point that is still a feasible, near-optimal portfolio
+        W = optimized.x
+        return optimized.success or (np.isfinite(W).all() and W.min() > -FEASIBILITY_TOLERANCE and W.max() < 1 + FEASIBILITY_TOLERANCE and
+                                     abs(total_weight(W)) < FEASIBILITY_TOLERANCE and abs(target_return(W, r)) < FEASIBILITY_TOLERANCE)
+
     frontier_mean, frontier_var, frontier_weights = [], [], []
-    n = len(R) # Number of assets in the portfolio
-    for r in linspace(min(R), max(R), num=NUMBER_PORTFOLIOS_TO_GENERATE): # Iterate through the range of returns on Y axis
-        W = ones([n])/n  # Start optimization with equal weights
-        b_ = [(0,1) for i in range(n)]
-        c_ = ({'type':'eq', 'fun': lambda W: sum(W)-1. })
-        optimized = scipy.optimize.minimize(fitness, W, (R, C, r), method='SLSQP', constraints=c_, bounds=b_)
-        if not optimized.success:
+    b_ = [(0,1) for i in range(n)]
+    o_ = {'ftol': 1e-10, 'maxiter': 500}
+    W = ones([n])/n # Start first optimization with equal weights
+    for r in linspace(min(R), max(R), num=points): # Iterate through the range of returns on Y axis
+        optimized = minimize(W, r) # Warm start from the previous target's optimum
+        if not usable(optimized, r):
+            optimized = minimize(ones([n])/n, r)
+        if not usable(optimized, r):
             raise BaseException(optimized.message)
+        W = optimized.x
         # Add point to the min-var frontier [x,y] = [optimized.x, r]
         frontier_mean.append(r) # return
-        frontier_var.append(_port_var(optimized.x, C)) # min-variance based on optimized weights
-        frontier_weights.append(optimized.x)
+        frontier_var.append(_port_var(W, C)) # min-variance based on optimized weights
+        frontier_weights.append(W)
     return array(frontier_mean), array(frontier_var), frontier_weights
+
+def _cla_turning_points(R, C):
+    """
+    Runs the Critical Line Algorithm (long-only, fully invested).
+    :param R: numpy array of asset mean returns
+    :param C: numpy array of asset covariances
+    :return: (turning point means, turning point weights) ordered by increasing mean
+    """
+    mean    = np.asarray(R, dtype=float).reshape((-1, 1))
+    covar   = np.asarray(C, dtype=float)
+    n       = mean.shape[0]
+    cla     = CLA(mean, covar, np.zeros((n, 1)), np.ones((n, 1)))
+    cla.solve()
+
+    # CLA stores turning points from the maximum return portfolio down to the
+    # minimum variance portfolio
+    weights = np.hstack(cla.w).T[::-1]
+    means   = weights.dot(mean).ravel()
+    return means, weights
+
+def _max_sharpe_weights(turning_means, turning_weights, C, rf):
+    """
+    Weights of the maximum Sharpe ratio portfolio. Between turning points a and b
+    the frontier is w(t) = w_a + t.d (d = w_b - w_a), so with
+        e(t) = e_a + t.de        excess return over rf
+        v(t) = a + 2bt + ct^2    a = w_a'.C.w_a, b = w_a'.C.d, c = d'.C.d
+    d/dt e/sqrt(v) = 0 reduces to the *linear* equation
+        t.(de.b - e_a.c) + (de.a - e_a.b) = 0
+    solved for every segment at once. The best of the segment optima (clipped to
+    the segment) and the turning points themselves wins.
+    :param turning_means: numpy array of turning point means, increasing
+    :param turning_weights: numpy array (turning points x assets)
+    :param C: numpy array of asset covariances
+    :param rf: risk-free rate
+    """
+    if len(turning_means) == 1:
+        return turning_weights[0]
+
+    start       = turning_weights[:-1]
+    direction   = turning_weights[1:] - turning_weights[:-1]
+    excess      = turning_means[:-1] - rf
+    de          = turning_means[1:] - turning_means[:-1]
+
+    covar_start = start.dot(C)
+    a           = np.sum(covar_start * start, axis=1)
+    b           = np.sum(covar_start * direction, axis=1)
+    c           = np.einsum('ij,jk,ik->i', direction, C, direction)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (excess * b - de * a) / (de * b - excess * c)
+    t = np.clip(np.nan_to_num(t), 0, 1)
+
+    # Candidates: interior optimum and both ends of every segment
+    candidates  = np.vstack([ np.zeros_like(t), t, np.ones_like(t) ])
+    variances   = np.maximum(a + 2 * b * candidates + c * candidates ** 2, 1e-300)
+    sharpe      = (excess + de * candidates) / np.sqrt(variances)
+    row, segment = np.unravel_index(np.argmax(sharpe), sharpe.shape)
+    return start[segment] + candidates[row, segment] * direction[segment]
+
+def _cla_frontier(R, C, points=NUMBER_PORTFOLIOS_TO_GENERATE):
+    """
+    Same targets and output as _solve_frontier, but every portfolio is exact. The
+    frontier is linear in the weights between two turning points, so portfolios
+    for the target returns are interpolated from the turning points. Targets
+    below the minimum variance portfolio are not efficient, so they collapse
+    into the minimum variance portfolio itself.
+    :param R: numpy array of asset mean returns
+    :param C: numpy array of asset covariances
+    :param points: number of target returns
+    """
+    turning_means, turning_weights = _cla_turning_points(R, C)
+    covar   = np.asarray(C, dtype=float)
+
+    targets = linspace(min(R), max(R), num=points)
+    targets = np.clip(targets, turning_means[0], turning_means[-1])
+    targets = np.unique(targets)
+
+    if len(turning_means) == 1:
+        weights = np.repeat(turning_weights, len(targets), axis=0)
+    else:
+        upper   = np.clip(np.searchsorted(turning_means, targets), 1, len(turning_means) - 1)
+        lower   = upper - 1
+        spread  = turning_means[upper] - turning_means[lower]
+        spread[spread == 0] = 1.0
+        t       = ((targets - turning_means[lower]) / spread).reshape((-1, 1))
+        weights = turning_weights[lower] + t * (turning_weights[upper] - turning_weights[lower])
+
+    frontier_mean   = weights.dot(np.asarray(R, dtype=float))
+    frontier_var    = np.einsum('ij,jk,ik->i', weights, covar, weights)
+    return frontier_mean, frontier_var, weights
@@ -7,7 +7,8 @@ from __future__ import absolute_import
 import os
 import json
 import uuid
-import ystockquote
+
+from . import fetch
 
 
 ##############
@@ -54,4 +55,5 @@ def _formatted_etfs():
     }
 
 def _get_quotes(tickers):
-    return { ticker: float(ystockquote.get_price(ticker)) for ticker in tickers }
+    prices = fetch.run_concurrently(fetch.yahoo_quote, tickers)
+    return dict(zip(tickers, prices))
@@ -0,0 +1,83 @@
+###########
+# IMPORTS #
+###########
+
+from __future__ import absolute_import
+
+import numpy as np
+
+
+##############
+# PUBLIC API #
+##############
+
+class EWMAEstimator(object):
+    """
+    Exponentially weighted mean and covariance of monthly returns, updated one
+    month at a time in O(n^2) - history is never revisited. A month's weight
+    halves every `half_life` months.
+
+    Uses the weighted form of Welford's update, with every earlier weight
+    decayed before each month is added:
+        W' = l.W + 1
+        m' = m + (r - m) / W'
+        S' = l.S + (r - m)(r - m')'
+    The covariance is S over the effective sample size, W - sum(w^2) / W -
+    the same estimate as pandas' ewm(halflife=...).cov(), and the ordinary
+    sample covariance as the half life grows.
+    """
+
+    def __init__(self, half_life, asset_count):
+        self.half_life      = float(half_life)
+        self.decay          = 0.5 ** (1 / self.half_life)
+        self.weight         = 0.0                                   # W - sum of weights
+        self.weight_squares = 0.0                                   # sum of squared weights
+        self.mean           = np.zeros(asset_count)                 # m
+        self.deviations     = np.zeros((asset_count, asset_count))  # S - weighted sum of squared deviations
+        self.months         = 0
+
+    def update(self, returns):
+        """
+        Adds a month.
+        :param returns: numpy array (n) of the month's asset returns
+        """
+        returns             = np.asarray(returns, dtype=float)
+        self.weight         = self.decay * self.weight + 1
+        self.weight_squares = self.decay * self.decay * self.weight_squares + 1
+        delta               = returns - self.mean
+        self.mean          += delta / self.weight
+        self.deviations    *= self.decay
+        self.deviations    += np.outer(delta, returns - self.mean)
+        self.months        += 1
+
+    def covariance(self):
+        """
+        :return: numpy array (n x n) - NaN until two months have been added
+        """
+        effective_size = self.weight - self.weight_squares / self.weight if self.months > 1 else 0.0
+        if effective_size <= 0:
+            return np.full_like(self.deviations, np.nan)
+        return self.deviations / effective_size
+
+    def state(self):
+        """
+        :return: dict of numpy arrays to save the estimator as - see from_state()
+        """
+        return {
+            'half_life':        np.array(self.half_life),
+            'weight':           np.array(self.weight),
+            'weight_squares':   np.array(self.weight_squares),
+            'mean':             self.mean.copy(),
+            'deviations':       self.deviations.copy(),
+            'months':           np.array(self.months),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        estimator = cls(float(state['half_life']), len(state['mean']))
+        estimator.weight         = float(state['weight'])
+        estimator.weight_squares = float(state['weight_squares'])
+        estimator.mean           = np.array(state['mean'], dtype=float)
+        estimator.deviations     = np.array(state['deviations'], dtype=float)
+        estimator.months         = int(state['months'])
+        return estimator
@@ -0,0 +1,130 @@
+###########
+# IMPORTS #
+###########
+
+from __future__ import absolute_import
+
+import os
+import time
+import threading
+from   io import StringIO
+from   multiprocessing.pool import ThreadPool
+
+import requests
+import pandas as pd
+
+
+####################
+# MODULE VARIABLES #
+####################
+
+# Base URLs can be pointed at a local stand-in server
+YAHOO_HISTORY_URL   = os.environ.get('YAHOO_HISTORY_URL', 'http://ichart.finance.yahoo.com/table.csv')
+YAHOO_QUOTES_URL    = os.environ.get('YAHOO_QUOTES_URL', 'http://download.finance.yahoo.com/d/quotes.csv')
+QUANDL_URL          = os.environ.get('QUANDL_URL', 'https://www.quandl.com/api/v1/datasets')
+
+WORKERS             = int(os.environ.get('FETCH_WORKERS', 8))
+TIMEOUT             = float(os.environ.get('FETCH_TIMEOUT', 10))    # seconds, per request
+RETRIES             = int(os.environ.get('FETCH_RETRIES', 3))       # attempts after the first
+BACKOFF             = float(os.environ.get('FETCH_BACKOFF', 0.5))   # seconds, doubled on every retry
+
+_session      = None
+_session_lock = threading.Lock()
+
+
+##############
+# PUBLIC API #
+##############
+
+def run_concurrently(function, items, workers=None):
+    """
+    Calls function(item) for every item on a bounded pool of threads - fetches
+    spend their time waiting on the network.
+    :return: list of results in the order of `items`. The first exception raised
+    by any call is re-raised.
+    """
+    items = list(items)
+    if len(items) == 0:
+        return []
+    pool = ThreadPool(processes=min(workers or WORKERS, len(items)))
+    try:
+        return pool.map(function, items)
+    finally:
+        pool.close()
+        pool.join()
+
+def get(url, params=None):
+    """
+    GET with a per-request timeout, retrying connection errors, timeouts and 5xx
+    responses with exponential backoff. Connections are reused between calls.
+    :return: requests Response
+    """
+    attempt = 0
+    while True:
+        try:
+            response = session().get(url, params=params, timeout=TIMEOUT)
+            if response.status_code < 500:
+                response.raise_for_status()
+                return response
+            error = requests.exceptions.HTTPError("%s returned %d" % (url, response.status_code), response=response)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = e
+        if attempt >= RETRIES:
+            raise error
+        time.sleep(BACKOFF * (2 ** attempt))
+        attempt += 1
+
+def yahoo_prices(ticker, start, end):
+    """
+    Daily price history for a Yahoo finance ticker.
+    :param ticker: string, Yahoo finance ticker
+    :param start: first date (datetime.date)
+    :param end: last date (datetime.date)
+    :return: pandas DataFrame indexed by date - Open, High, Low, Close, Volume and Adjusted Close
+    """
+    params = {
+        's': ticker,
+        'a': start.month - 1, 'b': start.day, 'c': start.year,
+        'd': end.month - 1,   'e': end.day,   'f': end.year,
+        'g': 'd',
+        'ignore': '.csv',
+    }
+    df = _read_csv(get(YAHOO_HISTORY_URL, params))
+    return df.rename(columns={'Adj Close': 'Adjusted Close'})
+
+def yahoo_quote(ticker):
+    """
+    :return: last trade price for a Yahoo finance ticker, as a float
+    """
+    return float(get(YAHOO_QUOTES_URL, {'s': ticker, 'f': 'l1'}).content.strip())
+
+def quandl(dataset, **params):
+    """
+    Quandl dataset as a DataFrame indexed by date, one column per series (same
+    columns as Quandl.get).
+    :param dataset: Quandl code, e.g. "BOC/CDA_CPI"
+    :param params: Quandl API options, e.g. trim_start="2007-10-01", collapse="monthly"
+    """
+    params = dict(params)
+    params['auth_token'] = os.getenv('QUANDL_TOKEN', '')
+    return _read_csv(get("%s/%s.csv" % (QUANDL_URL, dataset), params))
+
+def session():
+    # Shared by all fetch threads so connections are kept alive between requests
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter  = requests.adapters.HTTPAdapter(pool_connections=WORKERS, pool_maxsize=WORKERS)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+    return _session
+
+
+###############
+# PRIVATE API #
+###############
+
+def _read_csv(response):
+    # Both sources return newest first
+    return pd.read_csv(StringIO(response.content.decode('utf-8')), index_col=0, parse_dates=True).sort_index()
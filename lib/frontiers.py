@@ -0,0 +1,296 @@
+###########
+# IMPORTS #
+###########
+
+from __future__ import absolute_import
+
+import os
+import json
+import hashlib
+import multiprocessing
+
+from six import string_types
+
+from .efficient_frontier import efficient_frontier
+from .efficient_frontier import optimal_portfolios
+from .efficient_frontier import turning_points
+from .efficient_frontier import METHODS
+from .efficient_frontier import NUMBER_PORTFOLIOS_TO_GENERATE
+from .efficient_frontier import MIN_POINTS
+from .efficient_frontier import MAX_POINTS
+from .market_data        import snapshot
+from .market_data        import COVARIANCE_SOURCES
+from .rolling            import window_label
+from .                   import jobs
+
+
+####################
+# MODULE VARIABLES #
+####################
+
+# Sorted set of frontier requests (see _usage_member) scored by request count
+USAGE_KEY = 'efficient_frontier_usage'
+
+# Usage entries beyond this rank are dropped after each prewarm, and the
+# remaining counts are halved so that old favourites fade out over time
+MAX_TRACKED_USAGE = 1000
+USAGE_DECAY = 0.5
+
+_pool = None
+
+
+##############
+# PUBLIC API #
+##############
+
+def cache_key(asset_ids, use_market_implied_returns=True, method='slsqp', points=NUMBER_PORTFOLIOS_TO_GENERATE,
+              covariance_source='covariance_matrix', window=None):
+    md5Hash = hashlib.md5("-".join(asset_ids)).hexdigest()
+    key = "efficient_frontier/" + md5Hash + "/" + ("implied" if use_market_implied_returns else "historical")
+    if method != 'slsqp':
+        key += "/" + method
+    if points != NUMBER_PORTFOLIOS_TO_GENERATE:
+        key += "/%s" % points
+    if covariance_source != 'covariance_matrix':
+        key += "/%s" % covariance_source
+    if window is not None:
+        key += "/window/" + window_label(window)
+    return key
+
+def optimal_cache_key(asset_ids, use_market_implied_returns=True):
+    # Stored next to the asset set's frontier
+    return cache_key(asset_ids, use_market_implied_returns) + "/optimal"
+
+def turning_points_cache_key(asset_ids, use_market_implied_returns=True):
+    return cache_key(asset_ids, use_market_implied_returns) + "/turning_points"
+
+def inputs(data, asset_ids, use_market_implied_returns=True, covariance_source='covariance_matrix', window=None):
+    """
+    Slices the efficient_frontier() inputs for asset_ids out of a MarketData.
+    :param covariance_source: one of COVARIANCE_SOURCES - historical mean returns are estimated the same way
+    :param window: months to take the covariances (and historical mean returns) over instead - see RollingStatistics.rows()
+    :return: (asset returns, historical returns, covariances)
+    """
+    if window is None:
+        returns_source = "reverse_optimized_returns" if use_market_implied_returns else COVARIANCE_SOURCES[covariance_source]
+        return (
+            data.returns_for(asset_ids, returns_source),
+            data.returns_for(asset_ids, "five_year_returns"),
+            data.covariance_matrix_for(asset_ids, covariance_source),
+        )
+    # Market implied returns come from the market portfolio, not a window of history
+    return (
+        data.returns_for(asset_ids, "reverse_optimized_returns") if use_market_implied_returns else data.window_returns_for(asset_ids, window),
+        data.returns_for(asset_ids, "five_year_returns"),
+        data.window_covariance_matrix_for(asset_ids, window),
+    )
+
+def build(data, asset_ids, use_market_implied_returns=True, method='slsqp', points=NUMBER_PORTFOLIOS_TO_GENERATE,
+          covariance_source='covariance_matrix', window=None):
+    asset_returns, historical_returns, covars = inputs(data, asset_ids, use_market_implied_returns, covariance_source, window)
+    return efficient_frontier(asset_ids, asset_returns, historical_returns, covars, method=method, points=points)
+
+def build_optimal(data, asset_ids, use_market_implied_returns=True):
+    asset_returns, historical_returns, covars = inputs(data, asset_ids, use_market_implied_returns)
+    return optimal_portfolios(asset_ids, asset_returns, historical_returns, covars)
+
+def build_turning_points(data, asset_ids, use_market_implied_returns=True):
+    asset_returns, historical_returns, covars = inputs(data, asset_ids, use_market_implied_returns)
+    return turning_points(asset_returns, covars)
+
+def record_usage(redis_conn, asset_ids, use_market_implied_returns=True, method='slsqp', points=NUMBER_PORTFOLIOS_TO_GENERATE,
+                 covariance_source='covariance_matrix'):
+    redis_conn.zincrby(USAGE_KEY, _usage_member(asset_ids, use_market_implied_returns, method, points, covariance_source), 1)
+
+def most_requested(redis_conn, count):
+    """
+    :return: list of (asset_ids, use_market_implied_returns, method, points, covariance_source), most requested first
+    """
+    members = redis_conn.zrevrange(USAGE_KEY, 0, count - 1)
+    requested = []
+    for member in members:
+        parsed = json.loads(member)
+        requested.append((
+            parsed['asset_ids'],
+            parsed['implied'],
+            parsed['method'],
+            parsed.get('points', NUMBER_PORTFOLIOS_TO_GENERATE),
+            parsed.get('covariance_source', 'covariance_matrix')
+        ))
+    return requested
+
+def build_many(data, requested, process_pool):
+    """
+    Builds several frontiers concurrently in a process pool.
+    :param data: MarketData
+    :param requested: list of (asset_ids, use_market_implied_returns, method, points, covariance_source)
+    :param process_pool: multiprocessing pool to solve in
+    :return: list of (frontier, error message) in the order of `requested` - one of the pair is None
+    """
+    results = [None] * len(requested)
+    indexes, jobs = [], []
+
+    for index, requested_frontier in enumerate(requested):
+        job, error = solve_job(data, *requested_frontier)
+        if job is None:
+            results[index] = (None, error)
+        else:
+            indexes.append(index)
+            jobs.append(job)
+
+    for index, result in zip(indexes, process_pool.map(_solve, jobs)):
+        results[index] = result
+    return results
+
+def solve_job(data, asset_ids, use_market_implied_returns=True, method='slsqp', points=NUMBER_PORTFOLIOS_TO_GENERATE,
+              covariance_source='covariance_matrix'):
+    """
+    Validates a frontier request and slices its inputs out of a MarketData.
+    :return: (job for a pool process, None) - or (None, error message)
+    """
+    error = validation_error(data, asset_ids, use_market_implied_returns, method, points, covariance_source)
+    if error is not None:
+        return None, error
+    asset_returns, historical_returns, covars = inputs(data, asset_ids, use_market_implied_returns, covariance_source)
+    return (asset_ids, asset_returns, historical_returns, covars, method, points), None
+
+def validation_error(data, asset_ids, use_market_implied_returns=True, method='slsqp', points=NUMBER_PORTFOLIOS_TO_GENERATE,
+                     covariance_source='covariance_matrix'):
+    """
+    Checks a frontier request as it came in, before its cache_key() is computed.
+    :return: error message, or None if the request is valid
+    """
+    if not isinstance(asset_ids, list) or not all(isinstance(asset_id, string_types) for asset_id in asset_ids):
+        return "Asset ids must be a list of strings"
+    unknown_asset_ids = data.universe.unknown(asset_ids)
+    if len(asset_ids) == 0:
+        return "No asset ids given"
+    elif len(set(asset_ids)) != len(asset_ids):
+        return "Duplicate asset ids"
+    elif len(unknown_asset_ids) > 0:
+        return "Unknown asset ids: %s" % ", ".join(sorted(unknown_asset_ids))
+    elif not isinstance(method, string_types) or method not in METHODS:
+        return "Unknown efficient frontier method: %s" % (method,)
+    elif not valid_points(points):
+        return "Frontier points must be between %d and %d" % (MIN_POINTS, MAX_POINTS)
+    elif not isinstance(covariance_source, string_types) or covariance_source not in list(data.covariances.keys()):
+        return "Covariance source not available: %s" % (covariance_source,)
+    return None
+
+def submit(store, job, name, process_pool, on_solved=None):
+    """
+    Starts solving a frontier in the background and returns straight away.
+    Progress is kept in the job store - a frontier already being solved under
+    the same name is not solved again, its job id is returned instead.
+    :param store: job store, see jobs.store()
+    :param job: as returned by solve_job()
+    :param name: unique name of the frontier, e.g. its cache_key
+    :param process_pool: multiprocessing pool to solve in
+    :param on_solved: called with the serialized frontier once it is solved, from another thread
+    :return: job id
+    """
+    # The pending state is saved before the claim, so a claimed job always has one
+    job_id = jobs.new_job_id()
+    store.save(job_id, { "status": jobs.PENDING })
+    running_id = store.claim(name, job_id)
+    if running_id != job_id:
+        if store.load(running_id) is not None:
+            store.delete(job_id)
+            return running_id
+        # The running job expired with the process solving it - take over
+        store.release(name)
+        store.claim(name, job_id)
+    jobs.hold(store, name, job_id)
+
+    def solved(result):
+        # Runs in the pool's result thread of this process - on_solved must be thread-safe.
+        # The heartbeat stops before the final state is saved, see RedisJobStore.refresh().
+        frontier, error = result
+        jobs.drop(name)
+        try:
+            if frontier is None:
+                store.save(job_id, { "status": jobs.FAILED, "error": error })
+            else:
+                store.save(job_id, { "status": jobs.DONE, "result": frontier })
+                if on_solved is not None:
+                    on_solved(json.dumps(frontier))
+        finally:
+            store.release(name)
+
+    process_pool.apply_async(_solve, (job,), callback=solved)
+    return job_id
+
+def valid_points(points):
+    return isinstance(points, int) and not isinstance(points, bool) and MIN_POINTS <= points <= MAX_POINTS
+
+def pool():
+    """
+    Process pool for solving frontiers off the request thread - created on first
+    use in each server worker. Size from FRONTIER_PROCESSES (default 2).
+    """
+    global _pool
+    if _pool is None:
+        _pool = multiprocessing.Pool(processes=int(os.environ.get('FRONTIER_PROCESSES', 2)))
+    return _pool
+
+def prewarm(redis_conn, cache, count, processes=None):
+    """
+    Recomputes the `count` most requested frontiers against the current data in
+    a process pool and stores them in the cache, so the first request after an
+    update does not pay for the solve.
+    :param redis_conn: redis connection
+    :param cache: TieredCache
+    :param count: number of frontiers to compute
+    :param processes: pool size - defaults to the number of CPUs
+    :return: number of frontiers cached
+    """
+    requested = most_requested(redis_conn, count)
+    if len(requested) == 0:
+        return 0
+
+    data = snapshot(redis_conn)
+    prewarm_pool = multiprocessing.Pool(processes=processes)
+    try:
+        results = build_many(data, requested, prewarm_pool)
+    finally:
+        prewarm_pool.close()
+        prewarm_pool.join()
+
+    cached = 0
+    for request, (frontier, error) in zip(requested, results):
+        if frontier is not None:
+            cache.set(cache_key(*request), json.dumps(frontier), data.generation)
+            cached += 1
+
+    _decay_usage(redis_conn)
+    return cached
+
+
+###############
+# PRIVATE API #
+###############
+
+def _usage_member(asset_ids, use_market_implied_returns, method, points, covariance_source):
+    # Options are left out when they are the default, so usage recorded before they existed still counts
+    member = {"asset_ids": asset_ids, "implied": use_market_implied_returns, "method": method}
+    if points != NUMBER_PORTFOLIOS_TO_GENERATE:
+        member["points"] = points
+    if covariance_source != 'covariance_matrix':
+        member["covariance_source"] = covariance_source
+    return json.dumps(member, sort_keys=True)
+
+def _solve(job):
+    # Runs in a pool process. One asset set that fails to solve should not fail
+    # the others in the same batch - the error is returned instead.
+    # efficient_frontier reports solver failures as BaseException.
+    asset_ids, asset_returns, historical_returns, covars, method, points = job
+    try:
+        return efficient_frontier(asset_ids, asset_returns, historical_returns, covars, method=method, points=points), None
+    except BaseException as e:
+        return None, "%s" % e
+
+def _decay_usage(redis_conn):
+    pipe = redis_conn.pipeline()
+    pipe.zunionstore(USAGE_KEY, {USAGE_KEY: USAGE_DECAY})
+    pipe.zremrangebyrank(USAGE_KEY, 0, -(MAX_TRACKED_USAGE + 1))
+    pipe.execute()
@@ -0,0 +1,174 @@
+###########
+# IMPORTS #
+###########
+
+from __future__ import absolute_import
+
+import os
+import json
+import time
+import uuid
+import threading
+
+
+####################
+# MODULE VARIABLES #
+####################
+
+PENDING = 'pending'
+DONE    = 'done'
+FAILED  = 'failed'
+
+# Seconds a finished job (and its result) is kept
+JOB_TTL = int(os.environ.get('JOB_TTL', 3600))
+
+# Seconds a running job's claim and pending state are kept without a
+# heartbeat - a job whose process died expires after this, see hold()
+CLAIM_TTL = int(os.environ.get('JOB_CLAIM_TTL', 60))
+
+KEY_PREFIX = 'job/'
+
+# Extends a claim (KEYS[1]) still held by ARGV[1] and a job state (KEYS[2])
+# still pending (ARGV[3]) to ARGV[2] seconds
+REFRESH_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then redis.call('EXPIRE', KEYS[1], ARGV[2]) end
+if redis.call('GET', KEYS[2]) == ARGV[3] then redis.call('EXPIRE', KEYS[2], ARGV[2]) end
+"""
+
+_local_store = None
+
+# Jobs this process is running, by name: (store, job id) - see hold()
+_held       = {}
+_held_lock  = threading.Lock()
+_heartbeat  = None
+
+
+##############
+# PUBLIC API #
+##############
+
+class RedisJobStore(object):
+    """
+    Job states kept in Redis, so a job submitted to one server worker can be
+    polled through any other. A state is a dict with "status" (PENDING, DONE or
+    FAILED) and the job's "result" or "error".
+    """
+
+    def __init__(self, redis_conn, ttl=JOB_TTL, claim_ttl=CLAIM_TTL):
+        self.redis_conn = redis_conn
+        self.ttl        = ttl
+        self.claim_ttl  = claim_ttl
+
+    def claim(self, name, job_id):
+        """
+        Registers job_id as the pending job for name, unless another job already is.
+        :return: job id of the job running for name - job_id if it was claimed
+        """
+        key = KEY_PREFIX + 'running/' + name
+        if self.redis_conn.set(key, job_id, ex=self.claim_ttl, nx=True):
+            return job_id
+        running = self.redis_conn.get(key)
+        return running.decode() if isinstance(running, bytes) else running
+
+    def release(self, name):
+        self.redis_conn.delete(KEY_PREFIX + 'running/' + name)
+
+    def refresh(self, name, job_id):
+        # Heartbeat of a running job - see hold(). Checked and extended in one
+        # script, so a beat racing the job's final save can not cut the life of
+        # its result (or of another job's claim) down to claim_ttl.
+        self.redis_conn.eval(REFRESH_SCRIPT, 2, KEY_PREFIX + 'running/' + name, KEY_PREFIX + job_id,
+                             job_id, self.claim_ttl, json.dumps({ "status": PENDING }))
+
+    def save(self, job_id, state):
+        # Pending states only live as long as their claim
+        ttl = self.claim_ttl if state["status"] == PENDING else self.ttl
+        self.redis_conn.setex(KEY_PREFIX + job_id, ttl, json.dumps(state))
+
+    def delete(self, job_id):
+        self.redis_conn.delete(KEY_PREFIX + job_id)
+
+    def load(self, job_id):
+        """
+        :return: state dict, or None for unknown and expired jobs
+        """
+        state = self.redis_conn.get(KEY_PREFIX + job_id)
+        return json.loads(state) if state is not None else None
+
+
+class LocalJobStore(object):
+    """
+    In-process job states for a single server process (development and tests)
+    - same interface as RedisJobStore. States do not expire.
+    """
+
+    def __init__(self):
+        self._states    = {}
+        self._running   = {}
+
+    def claim(self, name, job_id):
+        return self._running.setdefault(name, job_id)
+
+    def release(self, name):
+        self._running.pop(name, None)
+
+    def refresh(self, name, job_id):
+        pass
+
+    def save(self, job_id, state):
+        self._states[job_id] = state
+
+    def delete(self, job_id):
+        self._states.pop(job_id, None)
+
+    def load(self, job_id):
+        return self._states.get(job_id)
+
+
+def store(redis_conn):
+    """
+    Job store for this process - in-process if JOB_STORE is "local", otherwise Redis.
+    """
+    global _local_store
+    if os.environ.get('JOB_STORE') == 'local':
+        if _local_store is None:
+            _local_store = LocalJobStore()
+        return _local_store
+    return RedisJobStore(redis_conn)
+
+def new_job_id():
+    return uuid.uuid4().hex
+
+def hold(store, name, job_id):
+    """
+    Keeps the claim and pending state of a job this process is running alive
+    until drop() - refreshed every CLAIM_TTL / 3 seconds from a daemon thread,
+    so they expire soon after this process dies.
+    """
+    global _heartbeat
+    with _held_lock:
+        _held[name] = (store, job_id)
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=_keep_held_alive)
+            _heartbeat.daemon = True
+            _heartbeat.start()
+
+def drop(name):
+    with _held_lock:
+        _held.pop(name, None)
+
+
+###############
+# PRIVATE API #
+###############
+
+def _keep_held_alive():
+    while True:
+        time.sleep(CLAIM_TTL / 3.0)
+        with _held_lock:
+            held = list(_held.items())
+        for name, (store, job_id) in held:
+            try:
+                store.refresh(name, job_id)
+            except Exception:
+                pass # Retried on the next beat - the claim outlives two missed ones
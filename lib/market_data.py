@@ -0,0 +1,273 @@
+###########
+# IMPORTS #
+###########
+
+from __future__ import absolute_import
+
+import os
+
+import numpy  as np
+import pandas as pd
+
+from . import binary
+from . import panel
+from .universe import AssetUniverse
+from .rolling  import RollingStatistics
+
+
+####################
+# MODULE VARIABLES #
+####################
+
+# Bumped by update.py inside the same MULTI block that writes the data, so a
+# worker only needs to compare this one small value to know if its parsed copy
+# of the market data is stale.
+GENERATION_KEY = 'data_generation'
+
+RETURNS_SOURCES = ('reverse_optimized_returns', 'mean_returns', 'five_year_returns')
+
+# Covariance estimates frontiers can be built on => the historical returns
+# source estimated the same way. EWMA estimates are missing from data stored
+# before they existed.
+COVARIANCE_SOURCES = {
+    'covariance_matrix':        'mean_returns',
+    'ewma_covariance_matrix':   'ewma_returns',
+}
+
+# Non-asset monthly series simulated alongside the assets (see lib/retirement)
+MACRO_FACTORS = ('INFLATION', 'REAL_ESTATE')
+
+# Everything a MarketData is built from: key => pandas type of its JSON version,
+# or None for keys that were only ever stored packed (and may not exist yet)
+STORED_KEYS = dict(
+    [ (returns_source, 'series') for returns_source in RETURNS_SOURCES ] + [
+        ('std_dev_returns',             'series'),
+        ('covariance_matrix',           'frame'),
+        ('cholesky_decomposition',      'frame'),
+        ('excess_return_covariance',    None),
+        ('market_portfolio_weights',    None),
+        ('macro_mean_returns',          None),
+        ('macro_covariance',            None),
+        ('return_sums',                 None),
+        ('return_product_sums',         None),
+        ('ewma_returns',                None),
+        ('ewma_covariance_matrix',      None),
+    ]
+)
+
+# Reads of the JSON fallback that straddle an update are retried this many times
+MAX_LOAD_ATTEMPTS = 5
+
+# Per-snapshot limit on memoized subset Cholesky factors
+MAX_CACHED_FACTORS = 1024
+
+_snapshot = None
+
+
+##############
+# PUBLIC API #
+##############
+
+class MarketData(object):
+    """
+    Parsed, read-only view of a single generation of market data. Instances are
+    shared between requests in a worker - callers must not modify the frames.
+    """
+
+    def __init__(self, generation, covariance_matrix, cholesky_decomposition, returns, std_dev_returns, monthly_returns=None,
+                 excess_return_covariance=None, market_portfolio_weights=None, macro_mean_returns=None, macro_covariance=None, rolling=None,
+                 ewma_covariance_matrix=None):
+        self.generation               = generation
+        self.covariance_matrix        = covariance_matrix        # DataFrame
+        self.cholesky_decomposition   = cholesky_decomposition   # DataFrame
+        self.returns                  = returns                  # dict of returns_source => Series - RETURNS_SOURCES, and "ewma_returns" when stored
+        self.std_dev_returns          = std_dev_returns          # Series
+        self.monthly_returns          = monthly_returns          # DataFrame (dates x asset ids) - only available from a panel
+        self.excess_return_covariance = excess_return_covariance # DataFrame - None for data stored before it existed
+        self.market_portfolio_weights = market_portfolio_weights # Series - None for data stored before it existed
+        self.macro_mean_returns       = macro_mean_returns       # Series over MACRO_FACTORS - None for data stored before it existed
+        self.macro_covariance         = macro_covariance         # DataFrame (asset ids + MACRO_FACTORS x MACRO_FACTORS) - likewise
+        self.rolling                  = rolling                  # RollingStatistics - likewise
+        self.covariances              = { 'covariance_matrix': covariance_matrix } # dict of covariance_source => DataFrame
+        if ewma_covariance_matrix is not None:
+            self.covariances['ewma_covariance_matrix'] = ewma_covariance_matrix
+        self.universe                 = AssetUniverse(list(covariance_matrix.index)) # Everything is stored in asset id order
+        self._cholesky_factors        = {}
+
+    def covariance_matrix_for(self, asset_ids, covariance_source='covariance_matrix'):
+        """
+        :param covariance_source: one of COVARIANCE_SOURCES stored for this data - see self.covariances
+        """
+        subset, positions = self.universe.subset(asset_ids)
+        covariances = self.covariances[covariance_source].values
+        return pd.DataFrame(covariances[np.ix_(positions, positions)], index=list(subset), columns=list(subset))
+
+    def cholesky_decomposition_for(self, asset_ids):
+        """
+        Lower-triangular Cholesky factor of the covariance matrix of asset_ids.
+        Rows/columns of the full factor are *not* the factor of a subset, so the
+        subset covariance is factored (once per subset per generation). A subset
+        that is a leading block of the canonical ordering is just the leading
+        block of the full factor.
+        """
+        subset, positions = self.universe.subset(asset_ids)
+
+        factor = self._cholesky_factors.get(subset)
+        if factor is None:
+            size = len(subset)
+            if size == 0 or positions[-1] == size - 1: # Positions are sorted, so this is a leading block
+                factor = self.cholesky_decomposition.iloc[:size, :size]
+            else:
+                covars = self.covariance_matrix_for(subset)
+                factor = pd.DataFrame(np.linalg.cholesky(covars.values), index=covars.index, columns=covars.columns)
+            if len(self._cholesky_factors) >= MAX_CACHED_FACTORS:
+                self._cholesky_factors.clear()
+            self._cholesky_factors[subset] = factor
+        return factor
+
+    def returns_for(self, asset_ids, returns_source):
+        """
+        :param asset_ids: array of asset ID's (e.g. INTL-STOCK) - all assets if empty
+        :param returns_source: one of RETURNS_SOURCES
+        """
+        if len(asset_ids) == 0:
+            return self.returns[returns_source]
+        return self._take(self.returns[returns_source], asset_ids)
+
+    def std_dev_returns_for(self, asset_ids):
+        if len(asset_ids) == 0:
+            return self.std_dev_returns
+        return self._take(self.std_dev_returns, asset_ids)
+
+    def window_returns_for(self, asset_ids, window):
+        """
+        Mean returns over a window of months - see RollingStatistics.rows()
+        :raise ValueError: for windows not covered by the data
+        """
+        subset, positions = self.universe.subset(asset_ids)
+        return pd.Series(self.rolling.mean_returns(positions, window), index=list(subset))
+
+    def window_covariance_matrix_for(self, asset_ids, window):
+        subset, positions = self.universe.subset(asset_ids)
+        return pd.DataFrame(self.rolling.covariance(positions, window), index=list(subset), columns=list(subset))
+
+    def _take(self, series, asset_ids):
+        subset, positions = self.universe.subset(asset_ids)
+        return pd.Series(series.values.take(positions), index=list(subset))
+
+
+def binary_key(key):
+    # Redis key holding the lib.binary packed version of `key`
+    return key + ':f8'
+
+def current_generation(redis_conn):
+    return _generation(redis_conn.get(GENERATION_KEY))
+
+def panel_path():
+    # Set PANEL_PATH when update.py runs on the same machine as the server
+    return os.environ.get('PANEL_PATH')
+
+def snapshot(redis_conn):
+    """
+    Returns the MarketData for the current generation. Data is only loaded when
+    the generation has changed since the last call in this process - mapped
+    from the shared panel file if it holds this generation, otherwise fetched
+    and parsed from Redis.
+    :param redis_conn: redis connection
+    """
+    global _snapshot
+    generation = current_generation(redis_conn)
+    if _snapshot is None or _snapshot.generation != generation:
+        _snapshot = _load_panel(generation) or _load(redis_conn)
+    return _snapshot
+
+
+###############
+# PRIVATE API #
+###############
+
+def _load(redis_conn):
+    """
+    Reads every stored value in a single MGET together with the generation key.
+    update.py writes them all in one MULTI, so the values and the generation
+    they are labelled with always belong together.
+    Values without a packed copy (data written before the binary keys existed)
+    are read from their JSON keys in a second MGET - retried from the start if
+    the generation moved in between.
+    """
+    keys = sorted(STORED_KEYS.keys())
+    for attempt in range(MAX_LOAD_ATTEMPTS):
+        values      = redis_conn.mget([GENERATION_KEY] + [ binary_key(key) for key in keys ])
+        generation  = _generation(values[0])
+        stored      = dict( (key, binary.unpack(packed)) for key, packed in zip(keys, values[1:]) if packed is not None )
+
+        missing = [ key for key in keys if key not in stored and STORED_KEYS[key] is not None ]
+        if len(missing) > 0:
+            values = redis_conn.mget([GENERATION_KEY] + missing)
+            if _generation(values[0]) != generation:
+                continue # Torn read
+            for key, value in zip(missing, values[1:]):
+                stored[key] = pd.io.json.read_json(value, typ=STORED_KEYS[key])
+
+        return MarketData(
+            generation               = generation,
+            covariance_matrix        = stored['covariance_matrix'],
+            cholesky_decomposition   = stored['cholesky_decomposition'],
+            returns                  = dict( (returns_source, stored[returns_source]) for returns_source in RETURNS_SOURCES + ('ewma_returns',) if returns_source in stored ),
+            std_dev_returns          = stored['std_dev_returns'],
+            excess_return_covariance = stored.get('excess_return_covariance'),
+            market_portfolio_weights = stored.get('market_portfolio_weights'),
+            macro_mean_returns       = stored.get('macro_mean_returns'),
+            macro_covariance         = stored.get('macro_covariance'),
+            rolling                  = _rolling_statistics(
+                list(stored['return_sums'].index),
+                stored['return_sums'].values,
+                stored['return_product_sums'].values
+            ) if 'return_sums' in stored and 'return_product_sums' in stored else None,
+            ewma_covariance_matrix   = stored.get('ewma_covariance_matrix'),
+        )
+
+    raise IOError("Market data changed during %d consecutive reads" % MAX_LOAD_ATTEMPTS)
+
+def _load_panel(generation):
+    path = panel_path()
+    if path is None:
+        return None
+    mapped = panel.open_panel(path)
+    if mapped is None or mapped.generation != generation:
+        return None
+
+    asset_ids = mapped.asset_ids
+    names     = set(mapped.names())
+    dates     = pd.DatetimeIndex(mapped.array('dates'))
+    def series(name):
+        return pd.Series(mapped.array(name), index=asset_ids)
+    def frame(name, index):
+        return pd.DataFrame(mapped.array(name), index=index, columns=asset_ids, copy=False)
+
+    return MarketData(
+        generation               = generation,
+        covariance_matrix        = frame('covariance_matrix', asset_ids),
+        cholesky_decomposition   = frame('cholesky_decomposition', asset_ids),
+        returns                  = dict( (returns_source, series(returns_source)) for returns_source in RETURNS_SOURCES + ('ewma_returns',) if returns_source in names ),
+        std_dev_returns          = series('std_dev_returns'),
+        monthly_returns          = frame('monthly_returns', dates),
+        excess_return_covariance = frame('excess_return_covariance', asset_ids) if 'excess_return_covariance' in names else None,
+        market_portfolio_weights = series('market_portfolio_weights') if 'market_portfolio_weights' in names else None,
+        macro_mean_returns       = pd.Series(mapped.array('macro_mean_returns'), index=MACRO_FACTORS) if 'macro_mean_returns' in names else None,
+        macro_covariance         = pd.DataFrame(mapped.array('macro_covariance'), index=asset_ids + list(MACRO_FACTORS), columns=MACRO_FACTORS) if 'macro_covariance' in names else None,
+        rolling                  = _rolling_statistics(
+            [ date.strftime('%Y-%m') for date in dates ],
+            mapped.array('return_sums'),
+            mapped.array('return_product_sums')
+        ) if 'return_sums' in names else None,
+        ewma_covariance_matrix   = frame('ewma_covariance_matrix', asset_ids) if 'ewma_covariance_matrix' in names else None,
+    )
+
+def _rolling_statistics(months, return_sums, product_sums):
+    # Product sums are stored flattened in Redis - (months x n*n)
+    asset_count = return_sums.shape[1]
+    return RollingStatistics(months, return_sums, product_sums.reshape((len(return_sums), asset_count, asset_count)))
+
+def _generation(value):
+    return int(value) if value is not None else 0
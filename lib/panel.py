@@ -0,0 +1,113 @@
+###########
+# IMPORTS #
+###########
+
+from __future__ import absolute_import
+
+import os
+import json
+import mmap
+import struct
+
+import numpy as np
+
+
+####################
+# MODULE VARIABLES #
+####################
+
+# Layout of a panel file:
+#   magic, header length (uint64, little-endian)
+#   header  - utf-8 JSON: generation, tickers, asset ids, and for every array
+#             its dtype, shape and offset from the start of the data section
+#   padding - zero bytes so the data section starts on an 8 byte boundary
+#   data    - the arrays, each 8 byte aligned, little-endian, C order
+MAGIC       = b'RPPANEL1'
+PREAMBLE    = struct.Struct('<8sQ')
+ALIGNMENT   = 8
+
+
+##############
+# PUBLIC API #
+##############
+
+class Panel(object):
+    """
+    Read-only, memory-mapped view of a panel file. Arrays are views over the
+    mapping, so every process that opens the same file shares its pages.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as panel_file:
+            self._map = mmap.mmap(panel_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, header_length = PREAMBLE.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError("%s is not a panel file" % path)
+        header = json.loads(self._map[PREAMBLE.size:PREAMBLE.size + header_length].decode('utf-8'))
+
+        self.generation     = header['generation']
+        self.tickers        = header['tickers']
+        self.asset_ids      = header['asset_ids']
+        self._directory     = header['arrays']
+        self._data_start    = _aligned(PREAMBLE.size + header_length)
+
+    def names(self):
+        return list(self._directory.keys())
+
+    def array(self, name):
+        entry = self._directory[name]
+        dtype = np.dtype(str(entry['dtype']))
+        count = int(np.prod(entry['shape']))
+        return np.frombuffer(self._map, dtype=dtype, count=count, offset=self._data_start + entry['offset']).reshape(entry['shape'])
+
+
+def open_panel(path):
+    """
+    :return: Panel, or None if there is no panel file at path
+    """
+    if not os.path.exists(path):
+        return None
+    return Panel(path)
+
+def write(path, generation, tickers, asset_ids, arrays):
+    """
+    Writes a panel file. The new file is swapped in with an atomic rename, so
+    processes that already mapped the old file keep a consistent view of it.
+    :param generation: data generation the panel belongs to
+    :param tickers: tickers, in column order
+    :param asset_ids: asset ids, in column order
+    :param arrays: dict of name => numpy array (float64 data, int64 dates)
+    """
+    directory, blocks, offset = {}, [], 0
+    for name in sorted(arrays.keys()):
+        values = np.ascontiguousarray(arrays[name])
+        values = values.astype(values.dtype.newbyteorder('<'))
+        directory[name] = { 'dtype': values.dtype.str, 'shape': list(values.shape), 'offset': offset }
+        blocks.append(values)
+        offset = _aligned(offset + values.nbytes)
+
+    header = json.dumps({
+        'generation':   generation,
+        'tickers':      list(tickers),
+        'asset_ids':    list(asset_ids),
+        'arrays':       directory,
+    }).encode('utf-8')
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as panel_file:
+        panel_file.write(PREAMBLE.pack(MAGIC, len(header)))
+        panel_file.write(header)
+        panel_file.write(b'\0' * (_aligned(PREAMBLE.size + len(header)) - PREAMBLE.size - len(header)))
+        for values in blocks:
+            panel_file.write(bytes(values.data))
+            panel_file.write(b'\0' * (_aligned(values.nbytes) - values.nbytes))
+    os.rename(tmp_path, path)
+
+
+###############
+# PRIVATE API #
+###############
+
+def _aligned(offset):
+    return offset + (-offset % ALIGNMENT)
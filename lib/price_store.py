@@ -0,0 +1,113 @@
+###########
+# IMPORTS #
+###########
+
+from __future__ import absolute_import
+
+import os
+
+import numpy  as np
+import pandas as pd
+
+
+####################
+# MODULE VARIABLES #
+####################
+
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), os.pardir, 'csv', 'prices.npz')
+
+
+##############
+# PUBLIC API #
+##############
+
+def path():
+    return os.environ.get('PRICE_STORE_PATH', DEFAULT_PATH)
+
+def save(prices, monthly_prices=None, store_path=None):
+    """
+    Writes a price panel (dates x tickers) as a columnar npz file: the date
+    index, the ticker names and one float64 block - plus the same again for the
+    derived monthly panel, if given. The file is replaced atomically so a reader
+    never sees a partial write.
+    :param prices: pandas DataFrame of daily prices indexed by date, one column per ticker
+    :param monthly_prices: pandas DataFrame of monthly prices derived from `prices`
+    """
+    store_path = store_path or path()
+    tmp_path   = store_path + '.tmp'
+    arrays     = _arrays(prices)
+    if monthly_prices is not None:
+        for name, values in _arrays(monthly_prices).items():
+            arrays['monthly_' + name] = values
+    with open(tmp_path, 'wb') as store:
+        np.savez(store, **arrays)
+    os.rename(tmp_path, store_path)
+
+def load(store_path=None):
+    """
+    :return: pandas DataFrame of daily prices, or None if nothing has been stored yet
+    """
+    return _load(store_path, prefix='')
+
+def load_monthly(store_path=None):
+    """
+    :return: pandas DataFrame of monthly prices, or None if none were stored
+    """
+    return _load(store_path, prefix='monthly_')
+
+def save_checkpoint(name, arrays, store_path=None):
+    """
+    Saves state derived from the stored prices (e.g. an estimator that is
+    updated as months are added) in a file next to the store - replaced
+    atomically, like the store itself.
+    :param arrays: dict of name => numpy array
+    """
+    checkpoint_path = _checkpoint_path(name, store_path)
+    tmp_path        = checkpoint_path + '.tmp'
+    with open(tmp_path, 'wb') as checkpoint:
+        np.savez(checkpoint, **arrays)
+    os.rename(tmp_path, checkpoint_path)
+
+def load_checkpoint(name, store_path=None):
+    """
+    :return: dict of numpy arrays, or None if no checkpoint has been saved
+    """
+    checkpoint_path = _checkpoint_path(name, store_path)
+    if not os.path.exists(checkpoint_path):
+        return None
+    checkpoint = np.load(checkpoint_path)
+    try:
+        return dict( (key, checkpoint[key]) for key in checkpoint.files )
+    finally:
+        checkpoint.close()
+
+
+###############
+# PRIVATE API #
+###############
+
+def _checkpoint_path(name, store_path):
+    return os.path.splitext(store_path or path())[0] + '.' + name + '.npz'
+
+def _arrays(prices):
+    return {
+        'dates':    prices.index.values.astype('datetime64[ns]'),
+        'tickers':  np.array([ u'%s' % ticker for ticker in prices.columns ]),
+        'prices':   prices.values.astype(np.float64),
+    }
+
+def _load(store_path, prefix):
+    store_path = store_path or path()
+    if not os.path.exists(store_path):
+        return None
+    store = np.load(store_path)
+    try:
+        if prefix + 'prices' not in store.files:
+            return None
+        return pd.DataFrame(
+            store[prefix + 'prices'],
+            index   = pd.DatetimeIndex(store[prefix + 'dates']),
+            columns = list(store[prefix + 'tickers'])
+        )
+    finally:
+        store.close()
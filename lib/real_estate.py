@@ -5,7 +5,15 @@
 from __future__ import absolute_import
 
 import json
-import Quandl
+
+from . import fetch
+
+
+####################
+# MODULE VARIABLES #
+####################
+
+source_data = None # Memoized - also used for the joint statistics in lib/assets
 
 
 ##############
@@ -15,6 +23,9 @@ import Quandl
 def real_estate_json():
     return json.dumps(_json_data_obj())
 
+def monthly_returns():
+    return _source_data().pct_change()
+
 
 ###############
 # PRIVATE API #
@@ -23,11 +34,14 @@ def real_estate_json():
 def _source_data(trim_start="2007-10-01"):
     # Trimming to 2007-10-01 to be on ~ the same timescale as have data for all
     # other securities.
-    df = Quandl.get("SANDP/HPI_COMPOSITE10_SA", trim_start=trim_start, collapse="monthly")
-    return df['Index']
+    global source_data
+    if source_data is None:
+        df = fetch.quandl("SANDP/HPI_COMPOSITE10_SA", trim_start=trim_start, collapse="monthly")
+        source_data = df['Index']
+    return source_data
 
 def _json_data_obj():
-    returns = _source_data().pct_change()
+    returns = monthly_returns()
     return {
         "mean":     returns.mean(),
         "std_dev":  returns.std(),
@@ -0,0 +1,34 @@
+###########
+# IMPORTS #
+###########
+
+from __future__ import absolute_import
+
+import os
+import redis
+
+
+####################
+# MODULE VARIABLES #
+####################
+
+_pool = None
+
+
+##############
+# PUBLIC API #
+##############
+
+def client():
+    """
+    Redis client on the process-wide connection pool for REDIS_URL, so every
+    client in a worker reuses the same connections. The pool discards
+    connections inherited across a fork.
+    """
+    global _pool
+    if _pool is None:
+        redis_url = os.getenv('REDIS_URL')
+        if redis_url is None:
+            raise KeyError("%s not present" % "REDIS_URL")
+        _pool = redis.ConnectionPool.from_url(redis_url)
+    return redis.StrictRedis(connection_pool=_pool)
@@ -0,0 +1,186 @@
+###########
+# IMPORTS #
+###########
+
+from __future__ import absolute_import
+
+import numpy as np
+
+from .simulation import CHUNK_SIZE
+from .simulation import MIN_RETURN
+from .simulation import PERCENTILES
+
+
+####################
+# MODULE VARIABLES #
+####################
+
+# Optional plan settings - see simulate_plans()
+PLAN_DEFAULTS = {
+    "initial_savings":          0.0,
+    "monthly_contribution":     0.0,
+    "monthly_withdrawal":       0.0,
+    "retirement_month":         0,
+    "real_estate_value":        0.0,
+}
+
+# Simulation stops once the confidence interval of every plan's success
+# probability is narrower than +/- tolerance, checked after every chunk
+DEFAULT_TOLERANCE   = 0.005
+CONFIDENCE_Z        = 1.96 # 95%
+MIN_PATHS           = 1000
+MAX_PATHS           = 50000
+
+
+##############
+# PUBLIC API #
+##############
+
+def factor_moments(expected_returns, covariance_matrix, macro_mean_returns, macro_covariance, weights):
+    """
+    Mean and covariance of the monthly (portfolio, inflation, real estate)
+    returns of every plan - the portfolio rebalanced monthly to its weights.
+    :param expected_returns: numpy array (n) of monthly asset returns
+    :param covariance_matrix: numpy array (n x n) of asset covariances
+    :param macro_mean_returns: numpy array (2) - monthly inflation and real estate returns
+    :param macro_covariance: numpy array (n + 2 x 2) - covariances of the assets, then inflation and real estate, with inflation and real estate
+    :param weights: numpy array (plans x n) of asset weights
+    :return: (numpy array (plans x 3) of means, numpy array (plans x 3 x 3) of covariances)
+    """
+    asset_count = len(expected_returns)
+    plans       = len(weights)
+    means       = np.empty((plans, 3))
+    covs        = np.empty((plans, 3, 3))
+
+    means[:, 0]     = np.dot(weights, expected_returns)
+    means[:, 1:]    = macro_mean_returns
+    covs[:, 0, 0]   = np.sum(np.dot(weights, covariance_matrix) * weights, axis=1)
+    covs[:, 0, 1:]  = np.dot(weights, macro_covariance[:asset_count])
+    covs[:, 1:, 0]  = covs[:, 0, 1:]
+    covs[:, 1:, 1:] = macro_covariance[asset_count:]
+    return means, covs
+
+def simulate_plans(means, covariances, plans, seed=None, tolerance=DEFAULT_TOLERANCE,
+                   min_paths=MIN_PATHS, max_paths=MAX_PATHS, percentiles=PERCENTILES, chunk_size=CHUNK_SIZE):
+    """
+    Monte Carlo simulation of many retirement plans at once. Every month each
+    plan's portfolio, inflation and real estate returns are drawn jointly, the
+    portfolio grows by its return, and the plan's contribution (before
+    retirement_month) is added or its withdrawal (from retirement_month) taken
+    out - both given in today's money and indexed to the simulated inflation.
+    A plan is ruined when its portfolio runs out; its real estate is held
+    throughout and counts towards terminal wealth.
+
+    Paths are simulated in chunks until the confidence interval of every plan's
+    success probability is within +/- tolerance (or max_paths is reached).
+
+    :param means: numpy array (plans x 3) - see factor_moments()
+    :param covariances: numpy array (plans x 3 x 3) - see factor_moments()
+    :param plans: list of dicts - "months" and optionally the PLAN_DEFAULTS keys
+    :param seed: random seed - the same seed gives the same result
+    :return: list of dicts of per plan statistics, in the order of `plans`
+    """
+    settings    = _plan_settings(plans)
+    months      = settings['months'].astype(int)
+    roots       = _covariance_roots(covariances)
+    random      = np.random.RandomState(seed)
+
+    simulated   = 0
+    ruined      = np.zeros(len(plans), dtype=np.int64)
+    terminal, real_terminal = [], []
+
+    while simulated < max_paths:
+        size = min(chunk_size, max_paths - simulated)
+        chunk_ruined, chunk_terminal, chunk_real_terminal = _simulate_chunk(means, roots, settings, months, size, random)
+        simulated += size
+        ruined += chunk_ruined
+        terminal.append(chunk_terminal)
+        real_terminal.append(chunk_real_terminal)
+
+        if simulated >= min_paths and np.all(_interval_half_width(simulated - ruined, simulated) <= tolerance):
+            break
+
+    terminal, real_terminal = np.vstack(terminal), np.vstack(real_terminal)
+    terminal_percentiles    = np.percentile(terminal, percentiles, axis=0)
+    real_percentiles        = np.percentile(real_terminal, percentiles, axis=0)
+    half_widths             = _interval_half_width(simulated - ruined, simulated)
+
+    results = []
+    for index in range(len(plans)):
+        success_probability = 1 - int(ruined[index]) / float(simulated)
+        results.append({
+            "paths":                        simulated,
+            "success_probability":          success_probability,
+            "probability_of_ruin":          1 - success_probability,
+            "success_confidence_interval":  [ max(success_probability - float(half_widths[index]), 0.0), min(success_probability + float(half_widths[index]), 1.0) ],
+            "mean_terminal_wealth":         float(terminal[:, index].mean()),
+            "terminal_wealth": [
+                { "percentile": percentile, "value": float(terminal_percentiles[row][index]) }
+                for row, percentile in enumerate(percentiles)
+            ],
+            "real_terminal_wealth": [
+                { "percentile": percentile, "value": float(real_percentiles[row][index]) }
+                for row, percentile in enumerate(percentiles)
+            ],
+        })
+    return results
+
+
+###############
+# PRIVATE API #
+###############
+
+def _plan_settings(plans):
+    # dict of setting => numpy array over plans
+    settings = {}
+    for key in ['months'] + list(PLAN_DEFAULTS.keys()):
+        settings[key] = np.array([ float(plan.get(key, PLAN_DEFAULTS.get(key))) for plan in plans ])
+    return settings
+
+def _covariance_roots(covariances):
+    # Symmetric square roots - unlike a Cholesky factor they exist for the
+    # semi-definite matrices mixing statistics over different periods can give
+    roots = np.empty_like(covariances)
+    for index, covariance in enumerate(covariances):
+        values, vectors = np.linalg.eigh(covariance)
+        roots[index] = np.dot(vectors * np.sqrt(np.maximum(values, 0)), vectors.T)
+    return roots
+
+def _simulate_chunk(means, roots, settings, months, size, random):
+    # All plans advance together, one month at a time, over `size` paths each
+    plans           = len(months)
+    value           = np.tile(settings['initial_savings'], (size, 1))
+    real_estate     = np.tile(settings['real_estate_value'], (size, 1))
+    price_level     = np.ones((size, plans))
+    ruined          = np.zeros((size, plans), dtype=bool)
+    terminal        = np.zeros((size, plans))
+    real_terminal   = np.zeros((size, plans))
+
+    for month in range(months.max()):
+        # (portfolio, inflation, real estate) growth factors, each paths x plans
+        shocks = random.standard_normal((3, size, plans))
+        growth = [
+            1 + np.maximum(means[:, factor] + roots[:, factor, 0] * shocks[0] + roots[:, factor, 1] * shocks[1] + roots[:, factor, 2] * shocks[2], MIN_RETURN)
+            for factor in range(3)
+        ]
+
+        price_level *= growth[1]
+        real_estate *= growth[2]
+        cash_flow    = np.where(month < settings['retirement_month'], settings['monthly_contribution'], -settings['monthly_withdrawal'])
+        value        = value * growth[0] + cash_flow * price_level
+
+        ruined      |= (value <= 0) & (month < months)
+        value[ruined] = 0.0
+
+        ending = months == month + 1
+        if ending.any():
+            terminal[:, ending]      = (value + real_estate)[:, ending]
+            real_terminal[:, ending] = terminal[:, ending] / price_level[:, ending]
+
+    return ruined.sum(axis=0), terminal, real_terminal
+
+def _interval_half_width(successes, paths):
+    # Half width of the Wilson score interval - stays meaningful at 0% and 100%
+    z           = CONFIDENCE_Z
+    proportion  = successes / float(paths)
+    return z * np.sqrt(proportion * (1 - proportion) / paths + z * z / (4.0 * paths * paths)) / (1 + z * z / paths)
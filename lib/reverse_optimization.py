@@ -0,0 +1,32 @@
+###########
+# IMPORTS #
+###########
+
+from __future__ import absolute_import
+
+import numpy as np
+
+
+##############
+# PUBLIC API #
+##############
+
+def implied_returns(excess_return_covariance, market_portfolio_weights, market_risk_premium, risk_free_rate):
+    """
+    Returns "market equilibrium" expected returns for a set of assets, based on
+    the Black-Litterman Reverse Portfolio Optimization method:
+        betas   = cov(R, R_mkt) / var(R_mkt) = S.w / w'.S.w
+        returns = betas * market_risk_premium + risk_free_rate
+    The covariance is the only input that depends on the price history, so it
+    is computed once per data update and any set of weights / premium can be
+    evaluated against it with a single matrix-vector product.
+    :param excess_return_covariance: numpy array (n x n) - covariances of historical returns in excess of the risk free rate
+    :param market_portfolio_weights: numpy array (n) of market portfolio composition weights, same order
+    :param market_risk_premium: estimation of the current market risk premium
+    :param risk_free_rate: estimation of the current risk-free rate
+    :return: numpy array (n) of market equilibrium returns
+    """
+    covariances_with_market = np.dot(excess_return_covariance, market_portfolio_weights)
+    market_variance         = np.dot(market_portfolio_weights, covariances_with_market)
+    betas                   = covariances_with_market / market_variance
+    return betas * market_risk_premium + risk_free_rate
@@ -24,7 +24,10 @@ ANNUAL_MARKET_RISK_PREMIUM = 0.0538 # http://pages.stern.nyu.edu/~%20adamodar/
 ##############
 
 def monthly_risk_free_rate():
-    return math.pow( (1 + ANNUALIZED_LONG_TERM_RISK_FREE_RATE), (1.0/12.0) ) - 1
+    return monthly_rate(ANNUALIZED_LONG_TERM_RISK_FREE_RATE)
 
 def monthly_market_risk_premium():
-    return math.pow( (1 + ANNUAL_MARKET_RISK_PREMIUM), (1.0/12.0) ) - 1
+    return monthly_rate(ANNUAL_MARKET_RISK_PREMIUM)
+
+def monthly_rate(annual_rate):
+    return math.pow( (1 + annual_rate), (1.0/12.0) ) - 1
@@ -0,0 +1,103 @@
+###########
+# IMPORTS #
+###########
+
+from __future__ import absolute_import
+
+import numpy as np
+
+
+####################
+# MODULE VARIABLES #
+####################
+
+# A covariance needs at least two months of returns
+MIN_WINDOW_MONTHS = 2
+
+
+##############
+# PUBLIC API #
+##############
+
+def prefix_sums(monthly_returns):
+    """
+    Running totals that the mean and covariance of any run of months can be
+    read off in O(n^2), whatever its length:
+        returns summed over months a+1..b   = return_sums[b] - return_sums[a]
+        r.r' summed over months a+1..b      = product_sums[b] - product_sums[a]
+    :param monthly_returns: numpy array (months x n) - the first month has no return (no previous price) and is not used
+    :return: (return_sums (months x n), product_sums (months x n x n)) - row k totals months 1..k, row 0 is zero
+    """
+    returns         = np.asarray(monthly_returns, dtype=float)[1:]
+    months, n       = len(returns) + 1, returns.shape[1]
+    return_sums     = np.zeros((months, n))
+    product_sums    = np.zeros((months, n, n))
+    np.cumsum(returns, axis=0, out=return_sums[1:])
+    np.cumsum(returns[:, :, np.newaxis] * returns[:, np.newaxis, :], axis=0, out=product_sums[1:])
+    return return_sums, product_sums
+
+def window_label(window):
+    """
+    :param window: number of trailing months, or (first month, last month) as "YYYY-MM" strings
+    :return: string identifying the window, e.g. for cache keys
+    """
+    if isinstance(window, int):
+        return "%d" % window
+    return "%s:%s" % tuple(window)
+
+
+class RollingStatistics(object):
+    """
+    Mean returns and covariances over any window of months, from prefix_sums().
+    """
+
+    def __init__(self, months, return_sums, product_sums):
+        """
+        :param months: "YYYY-MM" label of every row of the sums, in order
+        :param return_sums: numpy array (months x n), see prefix_sums()
+        :param product_sums: numpy array (months x n x n), see prefix_sums()
+        """
+        self.months         = np.asarray(months)
+        self.return_sums    = return_sums
+        self.product_sums   = product_sums
+
+    def rows(self, window):
+        """
+        :param window: number of trailing months, or (first month, last month) as "YYYY-MM" strings
+        :return: (start, end) rows - the window is months start+1..end
+        :raise ValueError: for windows that are malformed or not covered by the data
+        """
+        last = len(self.months) - 1
+        if isinstance(window, int) and not isinstance(window, bool):
+            start, end = last - window, last
+        elif isinstance(window, (list, tuple)) and len(window) == 2:
+            first_month, last_month = [ "%s" % month for month in window ]
+            start   = int(np.searchsorted(self.months, first_month)) - 1
+            end     = int(np.searchsorted(self.months, last_month))
+            if not (0 <= start < last and end <= last) or self.months[start + 1] != first_month or self.months[end] != last_month:
+                raise ValueError("Window months must be between %s and %s" % (self.months[1], self.months[last]))
+        else:
+            raise ValueError("Window must be a number of months or a [first month, last month] pair")
+        if start < 0 or end - start < MIN_WINDOW_MONTHS:
+            raise ValueError("Window must cover between %d and %d months" % (MIN_WINDOW_MONTHS, last))
+        return start, end
+
+    def mean_returns(self, positions, window):
+        """
+        :param positions: numpy array of asset positions (see AssetUniverse.subset)
+        :return: numpy array of mean monthly returns over the window
+        """
+        start, end = self.rows(window)
+        return (self.return_sums[end, positions] - self.return_sums[start, positions]) / float(end - start)
+
+    def covariance(self, positions, window):
+        """
+        Sample covariance (n - 1 denominator, like pandas) over the window.
+        :return: numpy array (positions x positions)
+        """
+        start, end  = self.rows(window)
+        count       = float(end - start)
+        sums        = self.return_sums[end, positions] - self.return_sums[start, positions]
+        block       = np.ix_(positions, positions)
+        products    = self.product_sums[end][block] - self.product_sums[start][block]
+        return (products - np.outer(sums, sums) / count) / (count - 1)
@@ -0,0 +1,141 @@
+###########
+# IMPORTS #
+###########
+
+from __future__ import absolute_import
+
+import math
+
+import numpy as np
+
+
+####################
+# MODULE VARIABLES #
+####################
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Paths simulated per NumPy batch - bounds memory to CHUNK_SIZE * months floats
+CHUNK_SIZE = 2000
+
+# Percentile bands are read off a per-month histogram of log portfolio values
+# rather than kept per path. Each month's bins cover +/- HISTOGRAM_WIDTH
+# standard deviations around the expected log value.
+HISTOGRAM_BINS  = 1000
+HISTOGRAM_WIDTH = 8.0
+
+# A monthly return can not lose more than everything
+MIN_RETURN = -1 + 1e-12
+
+
+##############
+# PUBLIC API #
+##############
+
+def portfolio_return_moments(expected_returns, cholesky_decomposition, weights):
+    """
+    Monthly mean and standard deviation of a portfolio rebalanced every month to
+    `weights`. With asset returns drawn as mean + L.z (z standard normal), the
+    portfolio return is w'.mean + (L'.w)'.z - normal with std dev |L'.w| - so
+    the factor is applied once and a path needs one draw per month, not one per
+    asset.
+    :param expected_returns: numpy array (n) of monthly asset returns
+    :param cholesky_decomposition: numpy array (n x n) - lower-triangular factor of the asset covariances
+    :param weights: numpy array (n) of asset weights, same order
+    :return: (mean, std_dev)
+    """
+    mean    = np.dot(weights, expected_returns)
+    std_dev = np.sqrt(np.sum(np.dot(cholesky_decomposition.T, weights) ** 2))
+    return mean, std_dev
+
+def simulate(expected_returns, cholesky_decomposition, weights, months, paths,
+             seed=None, initial_value=1.0, target_value=None, percentiles=PERCENTILES, chunk_size=CHUNK_SIZE):
+    """
+    Monte Carlo simulation of the value of a portfolio rebalanced every month to
+    `weights`. Paths are simulated CHUNK_SIZE at a time and only summarised -
+    they are never all held in memory.
+    :param expected_returns: numpy array (n) of monthly asset returns
+    :param cholesky_decomposition: numpy array (n x n) - lower-triangular factor of the asset covariances
+    :param weights: numpy array (n) of asset weights, same order
+    :param months: simulation horizon
+    :param paths: number of paths to simulate
+    :param seed: random seed - the same seed gives the same result
+    :param initial_value: portfolio value at the start
+    :param target_value: a path succeeds if it ends at or above this value (defaults to initial_value)
+    :param percentiles: percentiles of the portfolio value to report for every month
+    :return: dict of the percentile bands (one value per month) and success statistics
+    """
+    if target_value is None:
+        target_value = initial_value
+    mean, std_dev = portfolio_return_moments(expected_returns, cholesky_decomposition, weights)
+
+    random      = np.random.RandomState(seed)
+    histogram   = _LogValueHistogram(months, mean, std_dev)
+    log_target  = math.log(target_value / float(initial_value)) if target_value > 0 else -np.inf
+    successes   = 0
+    terminal    = 0.0
+
+    for start in range(0, paths, chunk_size):
+        size        = min(chunk_size, paths - start)
+        returns     = mean + std_dev * random.standard_normal((size, months))
+        log_values  = np.cumsum(np.log1p(np.maximum(returns, MIN_RETURN)), axis=1)
+        histogram.add(log_values)
+        successes  += np.count_nonzero(log_values[:, -1] >= log_target)
+        terminal   += np.exp(log_values[:, -1]).sum()
+
+    success_probability = successes / float(paths)
+    return {
+        "months":                   months,
+        "paths":                    paths,
+        "monthly_mean_return":      float(mean),
+        "monthly_std_dev":          float(std_dev),
+        "bands": [
+            { "percentile": percentile, "values": (initial_value * np.exp(histogram.percentile(percentile))).tolist() }
+            for percentile in percentiles
+        ],
+        "target_value":             target_value,
+        "success_probability":      success_probability,
+        "success_standard_error":   math.sqrt(success_probability * (1 - success_probability) / paths),
+        "mean_terminal_value":      initial_value * terminal / paths,
+    }
+
+
+###############
+# PRIVATE API #
+###############
+
+class _LogValueHistogram(object):
+    """
+    Counts of log portfolio values per month, in HISTOGRAM_BINS bins spanning
+    HISTOGRAM_WIDTH standard deviations either side of the month's expected log
+    value. Values outside the span fall in the end bins.
+    """
+
+    def __init__(self, months, mean, std_dev):
+        elapsed         = np.arange(1, months + 1)
+        log_mean        = math.log1p(max(mean, MIN_RETURN)) - 0.5 * std_dev ** 2
+        spread          = HISTOGRAM_WIDTH * max(std_dev, 1e-12) * np.sqrt(elapsed)
+
+        self.months     = months
+        self.lower      = elapsed * log_mean - spread
+        self.bin_width  = 2 * spread / HISTOGRAM_BINS
+        self.counts     = np.zeros(months * HISTOGRAM_BINS, dtype=np.int64)
+
+    def add(self, log_values):
+        # log_values: paths x months
+        bins = np.floor((log_values - self.lower) / self.bin_width)
+        bins = np.clip(bins, 0, HISTOGRAM_BINS - 1).astype(np.intp)
+        bins += np.arange(self.months) * HISTOGRAM_BINS
+        self.counts += np.bincount(bins.ravel(), minlength=self.counts.size)
+
+    def percentile(self, percentile):
+        # Linear interpolation inside the bin the percentile falls in
+        counts      = self.counts.reshape(self.months, HISTOGRAM_BINS)
+        cumulative  = np.cumsum(counts, axis=1)
+        rank        = percentile / 100.0 * cumulative[:, -1]
+        bins        = np.minimum((cumulative < rank[:, np.newaxis]).sum(axis=1), HISTOGRAM_BINS - 1)
+        months      = np.arange(self.months)
+        before      = np.where(bins > 0, cumulative[months, bins - 1], 0)
+        inside      = np.maximum(counts[months, bins], 1)
+        fraction    = np.clip((rank - before) / inside.astype(float), 0, 1)
+        return self.lower + (bins + fraction) * self.bin_width
@@ -0,0 +1,103 @@
+###########
+# IMPORTS #
+###########
+
+from __future__ import absolute_import
+
+import os
+import json
+
+import numpy as np
+
+
+####################
+# MODULE VARIABLES #
+####################
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), os.pardir, 'config', 'assets.json')
+
+# Per-universe limit on cached subset index arrays
+MAX_CACHED_SUBSETS = 1024
+
+_configured = None
+
+
+##############
+# PUBLIC API #
+##############
+
+class AssetUniverse(object):
+    """
+    A fixed set of assets and the integer positions of each in the canonical
+    (asset id sorted) order everything is stored in. Subsets are sliced out of
+    stored vectors and matrices by position - the index array for each subset is
+    built once and cached.
+    """
+
+    def __init__(self, asset_ids, tickers=None, assets=None):
+        """
+        :param asset_ids: asset ids
+        :param tickers: representative tickers, in the same order as asset_ids
+        :param assets: asset dicts from the config, if loaded from it
+        """
+        order = np.argsort(asset_ids, kind='mergesort')
+
+        self.assets     = assets
+        self.asset_ids  = [ asset_ids[i] for i in order ]
+        self.positions  = dict( (asset_id, position) for position, asset_id in enumerate(self.asset_ids) )
+        self._subsets   = {}
+
+        if tickers is not None:
+            self.tickers                = sorted(tickers)
+            self.ticker_for_id          = dict(zip(asset_ids, tickers))
+            self.id_for_ticker          = dict(zip(tickers, asset_ids))
+            self.ids_in_ticker_order    = [ self.id_for_ticker[ticker] for ticker in self.tickers ]
+            # Position in ticker sorted data of each asset, in canonical order
+            self.ticker_order           = np.argsort(self.ids_in_ticker_order, kind='mergesort')
+
+    def __len__(self):
+        return len(self.asset_ids)
+
+    def subset(self, asset_ids):
+        """
+        :param asset_ids: asset ids, in any order - unknown ids are left out
+        :return: (tuple of asset ids in canonical order, numpy array of their positions)
+        """
+        key = tuple(sorted(set(asset_ids)))
+        cached = self._subsets.get(key)
+        if cached is None:
+            known = tuple( asset_id for asset_id in key if asset_id in self.positions )
+            cached = (known, np.array([ self.positions[asset_id] for asset_id in known ], dtype=np.intp))
+            if len(self._subsets) >= MAX_CACHED_SUBSETS:
+                self._subsets.clear()
+            self._subsets[key] = cached
+        return cached
+
+    def unknown(self, asset_ids):
+        return set( asset_id for asset_id in asset_ids if asset_id not in self.positions )
+
+    def by_asset_id(self, values, axes=(0,)):
+        """
+        Reorders the ticker sorted axes of values into canonical order.
+        :param values: numpy array
+        :param axes: axes of values that run over the tickers
+        """
+        for axis in axes:
+            values = values.take(self.ticker_order, axis=axis)
+        return values
+
+
+def configured():
+    """
+    The AssetUniverse of config/assets.json - read once per process.
+    """
+    global _configured
+    if _configured is None:
+        with open(CONFIG_PATH) as data_file:
+            assets_list = json.load(data_file)
+        _configured = AssetUniverse(
+            [ el['id'] for el in assets_list ],
+            tickers = [ el['representative_ticker'] for el in assets_list ],
+            assets  = assets_list
+        )
+    return _configured
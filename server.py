@@ -6,8 +6,6 @@ from __future__ import absolute_import
 
 import os
 import json
-import redis
-import bmemcached
 import hashlib
 
 from flask import Flask
@@ -15,12 +13,29 @@ from flask import request
 from flask import Response
 from flask import jsonify
 from flask import abort
+from flask import g
 
 from flask_sslify import SSLify
 
+import numpy  as np
 import pandas as pd
 
-from lib.efficient_frontier import efficient_frontier
+from lib.efficient_frontier import METHODS as FRONTIER_METHODS
+from lib.efficient_frontier import NUMBER_PORTFOLIOS_TO_GENERATE
+from lib.efficient_frontier import frontier_portfolio
+from lib.reverse_optimization import implied_returns
+from lib.simulation import simulate
+from lib import retirement
+from lib import risk_free_rate
+from lib.market_data import snapshot
+from lib.market_data import current_generation
+from lib.market_data import GENERATION_KEY
+from lib.market_data import COVARIANCE_SOURCES
+from lib.redis_client import client as redis_client
+from lib.cache import client as memcache_client
+from lib.cache import TieredCache
+from lib import frontiers
+from lib import jobs
 
 
 ###############
@@ -42,16 +57,18 @@ if not app.config['DEBUG']:
     app.logger.info("Forcing SSL")
     sslify = SSLify(app)
 
-if app.config['DEBUG']:
-    cache = bmemcached.Client(servers=['127.0.0.1:11211'])
-else:
-    cache = bmemcached.Client(
-                servers=os.environ['MEMCACHEDCLOUD_SERVERS'].split(","),
-                username=os.environ['MEMCACHEDCLOUD_USERNAME'],
-                password=os.environ['MEMCACHEDCLOUD_PASSWORD']
-            )
+cache = TieredCache(memcache_client())
 
-redis_conn = redis.StrictRedis.from_url(os.environ['REDIS_URL'])
+# Upper bounds on the work a single /simulation request can ask for
+MAX_SIMULATION_MONTHS = 1200
+MAX_SIMULATION_PATHS  = 100000
+MAX_RETIREMENT_PLANS  = 100
+# Every /retirement plan is simulated over the longest plan's months, on as
+# many paths as the slowest converging plan needs. Paths x plans x months is
+# capped to stay well inside the worker timeout (~6M path-months a second).
+MAX_RETIREMENT_PATH_MONTHS = int(os.environ.get('MAX_RETIREMENT_PATH_MONTHS', 50000000))
+
+redis_conn = redis_client()
 
 
 ###################
@@ -73,34 +90,105 @@ def get_key_in_json(key, json):
         return abort(422)
     return json[key]
 
+def etag_for(*parts):
+    # Strong ETag for a response that only changes with the data generation and the given key parts
+    return hashlib.md5("/".join("%s" % part for part in parts)).hexdigest()
+
+def conditional_json_response(etag, build_body):
+    """
+    Answers If-None-Match with a 304 without building the body, otherwise serves
+    the (already serialized) JSON body returned by build_body().
+    """
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(build_body(), mimetype='application/json')
+    response.set_etag(etag)
+    return response
+
+def redis_json_response(key):
+    # Values that update.py stores as JSON are served as-is. The body is read in
+    # the same MGET as the generation, so its ETag cannot belong to another update.
+    etag = etag_for(current_generation(redis_conn), key)
+    if request.if_none_match.contains(etag):
+        return conditional_json_response(etag, None)
+    generation, body = redis_conn.mget([GENERATION_KEY, key])
+    return conditional_json_response(etag_for(int(generation or 0), key), lambda: body)
+
+def get_optional_key_in_json(key, json, default, choices=None):
+    if json is None or key not in json:
+        return default
+    if choices is not None and json[key] not in choices:
+        return abort(422)
+    return json[key]
+
+def window_in_json(json):
+    """
+    Optional "window" of months for historical statistics - a number of
+    trailing months, or [first month, last month] as "YYYY-MM" strings
+    :return: the window, or None if not given
+    """
+    window = get_optional_key_in_json('window', json, None)
+    if window is None:
+        return None
+    rolling = market_data().rolling
+    if rolling is None:
+        return abort(503) # Data stored before windowed statistics existed
+    if isinstance(window, list):
+        window = tuple(window)
+    try:
+        rolling.rows(window)
+    except ValueError:
+        return abort(422)
+    return window
+
+def covariance_source_in_json(json):
+    # One of COVARIANCE_SOURCES - 503 if the data has not been stored with it yet
+    covariance_source = get_optional_key_in_json('covariance_source', json, 'covariance_matrix', choices=sorted(COVARIANCE_SOURCES))
+    if covariance_source not in market_data().covariances:
+        return abort(503)
+    return covariance_source
+
+def frontier_request(json):
+    """
+    Frontier request options as given - check with frontiers.validation_error()
+    before using them. Asset ids are sorted if they can be.
+    :return: (asset_ids, use_market_implied_returns, method, points, covariance_source)
+    """
+    asset_ids = json.get('asset_ids')
+    if isinstance(asset_ids, list):
+        try:
+            asset_ids = sorted(asset_ids)
+        except TypeError:
+            pass # Not all strings - rejected by validation
+    return (
+        asset_ids,
+        bool(json.get('use_market_implied_returns', True)),
+        json.get('method', 'slsqp'),
+        json.get('points', NUMBER_PORTFOLIOS_TO_GENERATE),
+        json.get('covariance_source', 'covariance_matrix')
+    )
+
 
 ######################
 # APP HELPER METHODS #
 ######################
 
+def market_data():
+    # Resolved once per request, so everything a request reads (and the cache
+    # generations and ETags it uses) comes from the same generation. Parsed once
+    # per data generation and shared between requests in this worker.
+    if getattr(g, 'market_data', None) is None:
+        g.market_data = snapshot(redis_conn)
+    return g.market_data
+
 def covariance_matrix(asset_ids):
-    # No need to memoize this unless jsonify is taking lots of time - data from redis
     # Covariance matrix is a *DataFrame*
-    json = redis_conn.get('covariance_matrix')
-    df   = pd.io.json.read_json(json)
-
-    asset_ids_set             = set(asset_ids)
-    available_asset_ids_set   = set(df.index.values)
-    asset_ids_to_eliminate    = list(available_asset_ids_set - asset_ids_set)
-
-    return df.drop(asset_ids_to_eliminate, axis=0).drop(asset_ids_to_eliminate, axis=1)
+    return market_data().covariance_matrix_for(asset_ids)
 
 def cholesky_decomposition(asset_ids):
-    # No need to memoize this unless jsonify is taking lots of time - data from redis
     # Cholesky decomp matrix is a *DataFrame*
-    json = redis_conn.get('cholesky_decomposition')
-    df   = pd.io.json.read_json(json)
-
-    asset_ids_set             = set(asset_ids)
-    available_asset_ids_set   = set(df.index.values)
-    asset_ids_to_eliminate    = list(available_asset_ids_set - asset_ids_set)
-
-    return df.drop(asset_ids_to_eliminate, axis=0).drop(asset_ids_to_eliminate, axis=1)
+    return market_data().cholesky_decomposition_for(asset_ids)
 
 def mean_returns(asset_ids, returns_source):
     """
@@ -108,58 +196,129 @@ def mean_returns(asset_ids, returns_source):
     :param asset_ids: array of asset ID's (e.g. INTL-STOCK)
     :param returns_source: Which data we are interested in - one of: 'reverse_optimized_returns', 'mean_returns', 'five_year_returns'
     """
-
-    # No need to memoize this unless jsonify is taking lots of time - data from redis
     # Mean returns is a *Series*
-    json = redis_conn.get(returns_source)
-    df   = pd.io.json.read_json(json, typ='series')
-
-    if len(asset_ids) > 0:
-        asset_ids_set             = set(asset_ids)
-        available_asset_ids_set   = set(df.index.values)
-        asset_ids_to_eliminate    = list(available_asset_ids_set - asset_ids_set)
-        return df.drop(asset_ids_to_eliminate)
-    else:
-        return df
+    return market_data().returns_for(asset_ids, returns_source)
 
 def std_dev_returns(asset_ids):
-    # No need to memoize this unless jsonify is taking lots of time - data from redis
-    # Mean returns is a *Series*
-    json = redis_conn.get('std_dev_returns')
-    df   = pd.io.json.read_json(json, typ='series')
-
-    if len(asset_ids) > 0:
-        asset_ids_set             = set(asset_ids)
-        available_asset_ids_set   = set(df.index.values)
-        asset_ids_to_eliminate    = list(available_asset_ids_set - asset_ids_set)
-        return df.drop(asset_ids_to_eliminate)
-    else:
-        return df
+    # Std dev returns is a *Series*
+    return market_data().std_dev_returns_for(asset_ids)
 
-def build_efficient_frontier_for(asset_ids, use_market_implied_returns=True):
-    md5Hash = hashlib.md5("-".join(asset_ids)).hexdigest()
-    cache_key = "efficient_frontier/" + md5Hash + "/" + ("implied" if use_market_implied_returns else "historical")
-    val = cache.get(cache_key)
-    if val is None:
+def build_efficient_frontier_for(data, asset_ids, use_market_implied_returns=True, method='slsqp', points=NUMBER_PORTFOLIOS_TO_GENERATE,
+                                 covariance_source='covariance_matrix', window=None):
+    """
+    :param data: MarketData snapshot - the frontier is cached under its generation
+    :return: the frontier as serialized JSON - it is cached and served as bytes
+    """
+    cache_key = frontiers.cache_key(asset_ids, use_market_implied_returns, method, points, covariance_source, window)
+    def build():
         app.logger.info("[Cache Miss] Building efficient frontier for: %s" % asset_ids)
-        if use_market_implied_returns:
-            asset_returns = mean_returns(asset_ids, returns_source="reverse_optimized_returns")
-        else:
-            asset_returns = mean_returns(asset_ids, returns_source="mean_returns")
-        covars = covariance_matrix(asset_ids)
-        historical_returns = mean_returns(asset_ids, returns_source="five_year_returns")
-        frontier = efficient_frontier(asset_ids, asset_returns, historical_returns, covars)
-        # FIXME: You are json dumping to store in memcache, marshalling to return
-        # to request, then flask-jsonifying back again. Better way? For later......
-        cache.set(cache_key, json.dumps(frontier))
+        return json.dumps(frontiers.build(data, asset_ids, use_market_implied_returns, method, points, covariance_source, window))
+    val = cache.get_or_build(cache_key, build, data.generation)
+
+    return val
+
+def allocation_in_json(portfolio):
+    """
+    Portfolio to simulate, given either as {"allocation": {asset_id: weight}}
+    or as a portfolio of the (implied returns) efficient frontier:
+    {"asset_ids": [...], "frontier_portfolio": index}
+    :return: (asset ids in canonical order, numpy array of their weights)
+    """
+    if portfolio is None:
+        return abort(400)
+    if 'frontier_portfolio' in portfolio:
+        asset_ids = get_key_in_json('asset_ids', portfolio)
+        if frontiers.validation_error(market_data(), asset_ids) is not None:
+            return abort(422)
+        asset_ids = sorted(asset_ids)
+        portfolios = json.loads(build_efficient_frontier_for(market_data(), asset_ids))['portfolios']
+        try:
+            allocation = portfolios[int(portfolio['frontier_portfolio'])]['allocation']
+        except (IndexError, TypeError, ValueError):
+            return abort(422)
     else:
-        app.logger.info("[Cache Hit] Retreiving efficient frontier for: %s" % asset_ids)
-        # FIXME: You are json dumping to store in memcache, marshalling to return
-        # to request, then flask-jsonifying back again. Better way? For later......
-        frontier = json.loads(val)
+        allocation = get_key_in_json('allocation', portfolio)
+    if not isinstance(allocation, dict) or len(allocation) == 0:
+        return abort(422)
 
-    # app.logger.info("Frontier: %r" % frontier)
-    return frontier
+    universe = market_data().universe
+    if len(universe.unknown(allocation.keys())) > 0:
+        return abort(422)
+    asset_ids, positions = universe.subset(allocation.keys())
+    try:
+        weights = np.array([ float(allocation[asset_id]) for asset_id in asset_ids ])
+    except (TypeError, ValueError):
+        return abort(422)
+    return list(asset_ids), weights
+
+def build_optimal_portfolios_for(data, asset_ids, use_market_implied_returns=True):
+    """
+    :param data: MarketData snapshot - the portfolios are cached under its generation
+    :return: max Sharpe / min variance portfolios as serialized JSON - cached like the frontiers
+    """
+    cache_key = frontiers.optimal_cache_key(asset_ids, use_market_implied_returns)
+    def build():
+        app.logger.info("[Cache Miss] Building optimal portfolios for: %s" % asset_ids)
+        return json.dumps(frontiers.build_optimal(data, asset_ids, use_market_implied_returns))
+    val = cache.get_or_build(cache_key, build, data.generation)
+
+    return val
+
+def turning_points_for(asset_ids, use_market_implied_returns=True):
+    """
+    :return: the CLA turning points of the asset set - cached as JSON like the frontiers
+    """
+    cache_key = frontiers.turning_points_cache_key(asset_ids, use_market_implied_returns)
+    def build():
+        app.logger.info("[Cache Miss] Building turning points for: %s" % asset_ids)
+        return json.dumps(frontiers.build_turning_points(market_data(), asset_ids, use_market_implied_returns))
+    val = cache.get_or_build(cache_key, build, market_data().generation)
+
+    return json.loads(val)
+
+def build_efficient_frontiers_for(requested):
+    """
+    Batch version of build_efficient_frontier_for. Each request is validated
+    before its cache key is computed - an invalid one gets an error in its own
+    slot. Duplicates are only looked up once, cache hits are served directly and
+    misses are solved concurrently in the worker's frontier process pool.
+    :param requested: list of (asset_ids, use_market_implied_returns, method, points, covariance_source), see frontier_request
+    :return: serialized JSON list of {"frontier": ...} or {"error": ...} in the order of `requested`
+    """
+    data        = market_data()
+    results     = {}
+    slots       = [] # Cache key of each requested frontier, or its serialized error
+    misses      = []
+    for requested_frontier in requested:
+        error = frontiers.validation_error(data, *requested_frontier)
+        if error is not None:
+            slots.append(json.dumps({ "error": error }))
+            continue
+        cache_key = frontiers.cache_key(*requested_frontier)
+        slots.append(cache_key)
+        if cache_key in results:
+            continue
+        val = cache.get(cache_key, data.generation)
+        if val is None:
+            results[cache_key] = None
+            misses.append(requested_frontier)
+        else:
+            frontiers.record_usage(redis_conn, *requested_frontier)
+            results[cache_key] = '{"frontier": ' + val + '}'
+
+    app.logger.info("[Batch] %d frontiers requested, %d unique, %d cache misses" % (len(requested), len(results), len(misses)))
+    solved = frontiers.build_many(data, misses, frontiers.pool())
+    for requested_frontier, (frontier, error) in zip(misses, solved):
+        cache_key = frontiers.cache_key(*requested_frontier)
+        if frontier is None:
+            results[cache_key] = json.dumps({ "error": error })
+        else:
+            frontiers.record_usage(redis_conn, *requested_frontier)
+            val = json.dumps(frontier)
+            cache.set(cache_key, val, data.generation)
+            results[cache_key] = '{"frontier": ' + val + '}'
+
+    return '[' + ', '.join( results.get(slot, slot) for slot in slots ) + ']'
 
 
 ##########
@@ -188,39 +347,48 @@ def clear_cache():
 @app.route('/assets', methods=['GET'])
 def assets_route():
     check_for_authorization()
-    return jsonify( json.loads(redis_conn.get('asset_list')) )
+    return redis_json_response('asset_list')
 
 @app.route('/etfs', methods=['GET'])
 def etfs_route():
     check_for_authorization()
-    return jsonify( json.loads(redis_conn.get('etf_list')) )
+    return redis_json_response('etf_list')
 
 @app.route('/performance', methods=['GET'])
 def performance_route():
+    # Optional "window" - historical mean and std dev over those months only, see window_in_json
     check_for_authorization()
     asset_ids = get_key_in_json('asset_ids', request.json)
     asset_ids.sort()
+    window = window_in_json(request.json)
+    if window is None:
+        historical_mean = mean_returns(asset_ids, returns_source="mean_returns")
+        std_dev         = std_dev_returns(asset_ids)
+    else:
+        covars          = market_data().window_covariance_matrix_for(asset_ids, window)
+        historical_mean = market_data().window_returns_for(asset_ids, window)
+        std_dev         = pd.Series(np.sqrt(np.diag(covars.values)), index=covars.index)
     df = pd.DataFrame()
     df['mean'] = mean_returns(asset_ids, returns_source="reverse_optimized_returns")
-    df['historical_mean'] = mean_returns(asset_ids, returns_source="mean_returns")
+    df['historical_mean'] = historical_mean
     df['five_year_mean'] = mean_returns(asset_ids, returns_source="five_year_returns")
-    df['std_dev'] = std_dev_returns(asset_ids)
+    df['std_dev'] = std_dev
     return Response(df.transpose().to_json(), mimetype='application/json')
 
 @app.route('/quotes', methods=['GET'])
 def quotes_route():
     check_for_authorization()
-    return jsonify( json.loads(redis_conn.get('quotes')) )
+    return redis_json_response('quotes')
 
 @app.route('/inflation', methods=['GET'])
 def inflation_route():
     check_for_authorization()
-    return jsonify( json.loads(redis_conn.get('inflation')) )
+    return redis_json_response('inflation')
 
 @app.route('/real_estate', methods=['GET'])
 def real_estate_route():
     check_for_authorization()
-    return jsonify( json.loads(redis_conn.get('real_estate')) )
+    return redis_json_response('real_estate')
 
 @app.route('/cholesky', methods=['GET'])
 def cholesky_route():
@@ -232,13 +400,274 @@ def cholesky_route():
     as_flat_array = cholesky_dataframe_as_array.flatten().tolist() # Just do .tolist() if you want it as an array of arrays
     return jsonify( { "cholesky_decomposition": as_flat_array } )
 
+@app.route('/implied_returns', methods=['GET'])
+def implied_returns_route():
+    # Reverse optimized (market implied) monthly returns for every asset, for a
+    # caller supplied market portfolio and/or annual risk premium / risk free
+    # rate: {"market_weights": {"US-STOCK": 0.6, ...}, "annual_market_risk_premium": 0.05, "annual_risk_free_rate": 0.025}
+    # Assets missing from market_weights get a weight of 0.
+    check_for_authorization()
+    data = market_data()
+    if data.excess_return_covariance is None:
+        return abort(503)
+    covars = data.excess_return_covariance
+
+    market_weights = get_optional_key_in_json('market_weights', request.json, None)
+    if market_weights is None:
+        weights = data.market_portfolio_weights.values
+    else:
+        if not isinstance(market_weights, dict) or len(market_weights) == 0:
+            return abort(422)
+        weights = np.zeros(len(data.universe))
+        try:
+            for asset_id, weight in market_weights.items():
+                weights[data.universe.positions[asset_id]] = float(weight)
+        except (KeyError, TypeError, ValueError):
+            return abort(422)
+
+    try:
+        annual_premium  = float(get_optional_key_in_json('annual_market_risk_premium', request.json, risk_free_rate.ANNUAL_MARKET_RISK_PREMIUM))
+        annual_rfr      = float(get_optional_key_in_json('annual_risk_free_rate', request.json, risk_free_rate.ANNUALIZED_LONG_TERM_RISK_FREE_RATE))
+    except (TypeError, ValueError):
+        return abort(422)
+
+    returns = implied_returns(covars.values, weights, risk_free_rate.monthly_rate(annual_premium), risk_free_rate.monthly_rate(annual_rfr))
+    if not np.all(np.isfinite(returns)):
+        return abort(422) # e.g. all weights zero
+    return jsonify( { "implied_returns": dict(zip(covars.index, returns.tolist())) } )
+
+@app.route('/simulation', methods=['GET'])
+def simulation_route():
+    # Monte Carlo simulation of a portfolio rebalanced monthly, e.g.
+    # {"allocation": {"US-STOCK": 0.6, "US-LONG-GOV-BOND": 0.4}, "months": 360, "paths": 10000, "seed": 42}
+    # Optional: initial_value (1.0), target_value (initial_value), use_market_implied_returns (true)
+    check_for_authorization()
+    asset_ids, weights = allocation_in_json(request.json)
+    try:
+        months          = int(get_key_in_json('months', request.json))
+        paths           = int(get_optional_key_in_json('paths', request.json, 10000))
+        seed            = get_optional_key_in_json('seed', request.json, None)
+        seed            = int(seed) if seed is not None else None
+        initial_value   = float(get_optional_key_in_json('initial_value', request.json, 1.0))
+        target_value    = get_optional_key_in_json('target_value', request.json, None)
+        target_value    = float(target_value) if target_value is not None else None
+    except (TypeError, ValueError):
+        return abort(422)
+    if not (0 < months <= MAX_SIMULATION_MONTHS and 0 < paths <= MAX_SIMULATION_PATHS and initial_value > 0):
+        return abort(422)
+
+    use_market_implied_returns = bool(get_optional_key_in_json('use_market_implied_returns', request.json, True))
+    returns_source = "reverse_optimized_returns" if use_market_implied_returns else "mean_returns"
+    app.logger.info("Received simulation request (%d months, %d paths) for: %s" % (months, paths, asset_ids))
+
+    result = simulate(
+        mean_returns(asset_ids, returns_source).values,
+        cholesky_decomposition(asset_ids).values,
+        weights,
+        months,
+        paths,
+        seed            = seed,
+        initial_value   = initial_value,
+        target_value    = target_value
+    )
+    return jsonify(result)
+
+@app.route('/retirement', methods=['GET', 'POST'])
+def retirement_route():
+    # Batch of retirement plans, simulated together:
+    # {"plans": [{"allocation": {...}, "months": 480, "initial_savings": 50000, "monthly_contribution": 1000,
+    #             "retirement_month": 300, "monthly_withdrawal": 4000, "real_estate_value": 0}, ...],
+    #  "seed": 42, "tolerance": 0.005, "max_paths": 50000, "use_market_implied_returns": true}
+    # Cash flows are in today's money. Plans can also use "asset_ids" + "frontier_portfolio" like /simulation.
+    # Large batches are simulated on fewer paths than max_paths (see MAX_RETIREMENT_PATH_MONTHS) - every
+    # result reports its "paths" and confidence interval.
+    check_for_authorization()
+    data = market_data()
+    if data.macro_covariance is None:
+        return abort(503)
+    plans = get_key_in_json('plans', request.json)
+    if not isinstance(plans, list) or not (0 < len(plans) <= MAX_RETIREMENT_PLANS):
+        return abort(422)
+
+    weights = np.zeros((len(plans), len(data.universe)))
+    settings = []
+    for index, plan in enumerate(plans):
+        if not isinstance(plan, dict):
+            return abort(422)
+        asset_ids, plan_weights = allocation_in_json(plan)
+        weights[index, data.universe.subset(asset_ids)[1]] = plan_weights
+        try:
+            plan_settings = dict( (key, float(plan.get(key, default))) for key, default in retirement.PLAN_DEFAULTS.items() )
+            plan_settings['months'] = int(get_key_in_json('months', plan))
+        except (TypeError, ValueError):
+            return abort(422)
+        if not (0 < plan_settings['months'] <= MAX_SIMULATION_MONTHS):
+            return abort(422)
+        settings.append(plan_settings)
+
+    try:
+        seed        = get_optional_key_in_json('seed', request.json, None)
+        seed        = int(seed) if seed is not None else None
+        tolerance   = float(get_optional_key_in_json('tolerance', request.json, retirement.DEFAULT_TOLERANCE))
+        max_paths   = int(get_optional_key_in_json('max_paths', request.json, retirement.MAX_PATHS))
+    except (TypeError, ValueError):
+        return abort(422)
+    if not (tolerance > 0 and 0 < max_paths <= retirement.MAX_PATHS):
+        return abort(422)
+    affordable_paths = MAX_RETIREMENT_PATH_MONTHS // (len(plans) * max(plan_settings['months'] for plan_settings in settings))
+    if affordable_paths < min(retirement.MIN_PATHS, max_paths):
+        return abort(422) # Too many plans or months for one request - split the batch
+    max_paths = min(max_paths, affordable_paths)
+
+    use_market_implied_returns = bool(get_optional_key_in_json('use_market_implied_returns', request.json, True))
+    returns_source = "reverse_optimized_returns" if use_market_implied_returns else "mean_returns"
+    app.logger.info("Received retirement request for %d plans" % len(plans))
+
+    means, covariances = retirement.factor_moments(
+        data.returns[returns_source].values,
+        data.covariance_matrix.values,
+        data.macro_mean_returns.values,
+        data.macro_covariance.values,
+        weights
+    )
+    results = retirement.simulate_plans(means, covariances, settings, seed=seed, tolerance=tolerance,
+                                        min_paths=min(retirement.MIN_PATHS, max_paths), max_paths=max_paths)
+    return jsonify({ "results": results })
+
 @app.route('/efficient_frontier', methods=["GET"])
 def efficient_frontier_route():
     check_for_authorization()
     asset_ids = get_key_in_json('asset_ids', request.json)
-    asset_ids.sort()
-    app.logger.info("Received CLA Efficient Frontier request for: %s" % asset_ids)
-    return jsonify(build_efficient_frontier_for(asset_ids))
+    method = get_optional_key_in_json('method', request.json, 'slsqp', choices=FRONTIER_METHODS)
+    points = get_optional_key_in_json('points', request.json, NUMBER_PORTFOLIOS_TO_GENERATE)
+    if not frontiers.valid_points(points):
+        return abort(422)
+    # Optional "covariance_source" (one of COVARIANCE_SOURCES), or a "window" -
+    # covariances over those months only, see window_in_json
+    covariance_source = covariance_source_in_json(request.json)
+    window = window_in_json(request.json)
+    if window is not None and covariance_source != 'covariance_matrix':
+        return abort(422)
+    data = market_data()
+    if frontiers.validation_error(data, asset_ids, True, method, points, covariance_source) is not None:
+        return abort(422)
+    asset_ids = sorted(asset_ids)
+    app.logger.info("Received CLA Efficient Frontier request (%s, %d points, %s) for: %s" % (method, points, covariance_source, asset_ids))
+    # Usage drives which frontiers are prewarmed after each data update - count
+    # polls answered with a 304 as well, they will miss after the next update.
+    # Windowed frontiers are not prewarmed.
+    if window is None:
+        frontiers.record_usage(redis_conn, asset_ids, method=method, points=points, covariance_source=covariance_source)
+    # The body is built from (or cached under) the same snapshot's generation as the ETag
+    cache_key = frontiers.cache_key(asset_ids, method=method, points=points, covariance_source=covariance_source, window=window)
+    return conditional_json_response(
+        etag_for(data.generation, cache_key),
+        lambda: build_efficient_frontier_for(data, asset_ids, method=method, points=points, covariance_source=covariance_source, window=window)
+    )
+
+@app.route('/optimal_portfolios', methods=["GET"])
+def optimal_portfolios_route():
+    # {"asset_ids": [...]} => {"max_sharpe": portfolio, "min_variance": portfolio}, formatted like frontier portfolios
+    check_for_authorization()
+    asset_ids = get_key_in_json('asset_ids', request.json)
+    data = market_data()
+    if frontiers.validation_error(data, asset_ids) is not None:
+        return abort(422)
+    asset_ids = sorted(asset_ids)
+    app.logger.info("Received optimal portfolios request for: %s" % asset_ids)
+    return conditional_json_response(
+        etag_for(data.generation, frontiers.optimal_cache_key(asset_ids)),
+        lambda: build_optimal_portfolios_for(data, asset_ids)
+    )
+
+@app.route('/frontier_portfolio', methods=["GET"])
+def frontier_portfolio_route():
+    # Exact frontier portfolio at a target risk or return, e.g.
+    # {"asset_ids": [...], "annual_std_dev": 0.1} or {"asset_ids": [...], "annual_return": 0.07}
+    # Optional: use_market_implied_returns (true)
+    check_for_authorization()
+    asset_ids = get_key_in_json('asset_ids', request.json)
+    if frontiers.validation_error(market_data(), asset_ids) is not None:
+        return abort(422)
+    asset_ids = sorted(asset_ids)
+    annual_std_dev  = get_optional_key_in_json('annual_std_dev', request.json, None)
+    annual_return   = get_optional_key_in_json('annual_return', request.json, None)
+    if (annual_std_dev is None) == (annual_return is None):
+        return abort(422)
+    try:
+        annual_std_dev  = float(annual_std_dev) if annual_std_dev is not None else None
+        annual_return   = float(annual_return) if annual_return is not None else None
+    except (TypeError, ValueError):
+        return abort(422)
+    if (annual_std_dev is not None and not annual_std_dev >= 0) or (annual_return is not None and not annual_return > -1):
+        return abort(422)
+
+    use_market_implied_returns = bool(get_optional_key_in_json('use_market_implied_returns', request.json, True))
+    app.logger.info("Received frontier portfolio request for: %s" % asset_ids)
+
+    portfolio = frontier_portfolio(
+        asset_ids,
+        turning_points_for(asset_ids, use_market_implied_returns),
+        mean_returns(asset_ids, "five_year_returns").values,
+        covariance_matrix(asset_ids).values,
+        annual_std_dev  = annual_std_dev,
+        annual_return   = annual_return
+    )
+    return jsonify(portfolio)
+
+@app.route('/efficient_frontier_jobs', methods=["POST"])
+def efficient_frontier_jobs_route():
+    # Solves a frontier in the background:
+    # {"asset_ids": [...], "use_market_implied_returns": true, "method": "slsqp", "points": 20, "covariance_source": "covariance_matrix"}
+    # => 202 {"job_id": ..., "status": "pending"} - poll the Location for the result
+    check_for_authorization()
+    get_key_in_json('asset_ids', request.json) # 400 / 422 without any
+    requested_frontier = frontier_request(request.json)
+    asset_ids = requested_frontier[0]
+    job, error = frontiers.solve_job(market_data(), *requested_frontier)
+    if job is None:
+        return abort(422)
+
+    frontiers.record_usage(redis_conn, *requested_frontier)
+    cache_key   = frontiers.cache_key(*requested_frontier)
+    generation  = market_data().generation
+    job_store   = jobs.store(redis_conn)
+    val = cache.get(cache_key, generation)
+    if val is not None:
+        job_id = jobs.new_job_id()
+        job_store.save(job_id, { "status": jobs.DONE, "result": json.loads(val) })
+    else:
+        app.logger.info("Submitting efficient frontier job for: %s" % asset_ids)
+        job_id = frontiers.submit(job_store, job, cache_key, frontiers.pool(),
+                                  on_solved=lambda solved: cache.set(cache_key, solved, generation))
+
+    response = jsonify({ "job_id": job_id, "status": job_store.load(job_id)["status"] })
+    response.status_code = 202
+    response.headers['Location'] = '/efficient_frontier_jobs/' + job_id
+    return response
+
+@app.route('/efficient_frontier_jobs/<job_id>', methods=["GET"])
+def efficient_frontier_job_route(job_id):
+    # {"status": "pending"}, {"status": "done", "result": frontier} or {"status": "failed", "error": ...}
+    check_for_authorization()
+    state = jobs.store(redis_conn).load(job_id)
+    if state is None:
+        return abort(404) # Unknown, or expired after jobs.JOB_TTL
+    return jsonify(state)
+
+@app.route('/efficient_frontiers', methods=["GET", "POST"])
+def efficient_frontiers_route():
+    # Batch: {"frontiers": [{"asset_ids": [...], "use_market_implied_returns": true, "method": "slsqp", "points": 20,
+    #                       "covariance_source": "covariance_matrix"}, ...]}
+    check_for_authorization()
+    items = get_key_in_json('frontiers', request.json)
+    if not isinstance(items, list):
+        return abort(422)
+
+    # A malformed item comes back as an error in its own slot
+    requested = [ frontier_request(item if isinstance(item, dict) else {}) for item in items ]
+
+    return Response('{"results": ' + build_efficient_frontiers_for(requested) + '}', mimetype='application/json')
 
 
 ##########
@@ -0,0 +1,58 @@
+#  -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import numpy  as np
+import pandas as pd
+import pytest
+
+from lib import binary
+from lib import panel
+
+
+def test_series_round_trip():
+    series = pd.Series([ 0.01, -0.002, 0.0 ], index=[ 'US-STOCK', 'INTL-STOCK', 'CASH' ])
+    unpacked = binary.unpack(binary.pack(series))
+    assert list(unpacked.index) == list(series.index)
+    assert np.array_equal(unpacked.values, series.values)
+
+def test_dataframe_round_trip():
+    frame = pd.DataFrame([[ 1.0, 0.5 ], [ 0.5, 2.0 ], [ 0.1, 0.2 ]], index=[ 'a', 'b', 'c' ], columns=[ 'x', 'y' ])
+    unpacked = binary.unpack(binary.pack(frame))
+    assert list(unpacked.index) == list(frame.index)
+    assert list(unpacked.columns) == list(frame.columns)
+    assert np.array_equal(unpacked.values, frame.values)
+
+def test_non_ascii_labels_and_alignment():
+    # Label lengths decide the padding in front of the data
+    for label in [ u'é', u'ÉTF-€', u'a' * 7 ]:
+        series = pd.Series([ 1.5, 2.5 ], index=[ label, u'b' ])
+        packed = binary.pack(series)
+        row_labels, column_labels, values = binary.unpack_array(packed)
+        assert row_labels == [ label, u'b' ]
+        assert column_labels is None
+        assert values.tolist() == [ 1.5, 2.5 ]
+
+def test_unpack_rejects_other_data():
+    with pytest.raises(ValueError):
+        binary.unpack(b'\0' * binary.HEADER.size)
+
+def test_panel_round_trip(tmpdir):
+    path = str(tmpdir.join('panel.npz'))
+    arrays = {
+        'prices':   np.arange(12, dtype=float).reshape((4, 3)),
+        'dates':    np.array([ 1, 2, 3, 4 ], dtype=np.int64),
+        'odd':      np.array([ 0.5, 1.5, 2.5 ]),
+    }
+    panel.write(path, 7, [ 'VTI', 'VEU', 'BND' ], [ 'US-STOCK', u'INTL-STOCK-€', 'BOND' ], arrays)
+
+    opened = panel.open_panel(path)
+    assert opened.generation == 7
+    assert opened.tickers == [ 'VTI', 'VEU', 'BND' ]
+    assert opened.asset_ids == [ 'US-STOCK', u'INTL-STOCK-€', 'BOND' ]
+    assert sorted(opened.names()) == sorted(arrays.keys())
+    for name, values in arrays.items():
+        assert opened.array(name).dtype == values.dtype
+        assert np.array_equal(opened.array(name), values)
+
+def test_open_missing_panel(tmpdir):
+    assert panel.open_panel(str(tmpdir.join('missing'))) is None
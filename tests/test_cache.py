@@ -0,0 +1,119 @@
+from __future__ import absolute_import
+
+import time
+import threading
+
+import pytest
+
+from lib import cache
+from lib.cache import TieredCache
+
+
+class _Memcached(object):
+    # Dict-backed stand-in for the bmemcached client, counting reads
+    def __init__(self):
+        self.values = {}
+        self.reads  = 0
+
+    def get(self, key):
+        self.reads += 1
+        return self.values.get(key)
+
+    def set(self, key, value):
+        self.values[key] = value
+        return True
+
+    def add(self, key, value, time=0):
+        if key in self.values:
+            return False
+        self.values[key] = value
+        return True
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def flush_all(self):
+        self.values.clear()
+        return True
+
+
+def test_values_are_kept_per_generation():
+    remote  = _Memcached()
+    worker  = TieredCache(remote)
+    other   = TieredCache(remote)
+    worker.set('frontier', 'old', 1)
+
+    assert worker.get('frontier', 2) is None
+    assert other.get('frontier', 2) is None
+    assert other.get('frontier', 1) == 'old'
+
+    # A worker still on the old generation does not replace the new value
+    other.set('frontier', 'new', 2)
+    assert worker.get('frontier', 2) == 'new'
+    assert worker.get('frontier', 1) == 'old'
+    assert sorted(remote.values) == [ 'frontier@1', 'frontier@2' ]
+
+def test_local_entries_are_evicted_least_recently_used_first():
+    remote  = _Memcached()
+    local   = TieredCache(remote, size=2)
+    local.set('a', 1, 1)
+    local.set('b', 2, 1)
+    local.get('a', 1)
+    local.set('c', 3, 1) # evicts b
+
+    remote.reads = 0
+    assert local.get('a', 1) == 1
+    assert local.get('c', 1) == 3
+    assert remote.reads == 0
+    assert local.get('b', 1) == 2 # from memcached
+    assert remote.reads == 1
+
+def test_get_or_build_builds_once():
+    built   = []
+    local   = TieredCache(_Memcached())
+    build   = lambda: built.append(1) or 'value'
+    assert local.get_or_build('key', build, 1) == 'value'
+    assert local.get_or_build('key', build, 1) == 'value'
+    assert local.get_or_build('key', build, 2) == 'value'
+    assert len(built) == 2
+
+def test_failed_build_releases_its_lock():
+    remote  = _Memcached()
+    local   = TieredCache(remote)
+    def fail():
+        raise ValueError("no data")
+    with pytest.raises(ValueError):
+        local.get_or_build('key', fail, 1)
+    assert remote.values == {}
+
+    started = time.time()
+    assert local.get_or_build('key', lambda: 'value', 1) == 'value'
+    assert time.time() - started < cache.BUILD_WAIT
+
+def test_waits_for_another_workers_build(monkeypatch):
+    monkeypatch.setattr(cache, 'BUILD_POLL_INTERVAL', 0.01)
+    remote  = _Memcached()
+    builder = TieredCache(remote)
+    waiter  = TieredCache(remote)
+    remote.add('key@1/building', 'other worker')
+
+    timer = threading.Timer(0.1, lambda: builder.set('key', 'built elsewhere', 1))
+    timer.start()
+    try:
+        assert waiter.get_or_build('key', lambda: 'built here', 1) == 'built elsewhere'
+    finally:
+        timer.cancel()
+
+def test_builds_itself_after_waiting_for_a_stalled_build(monkeypatch):
+    monkeypatch.setattr(cache, 'BUILD_POLL_INTERVAL', 0.01)
+    monkeypatch.setattr(cache, 'BUILD_WAIT', 0.05)
+    remote  = _Memcached()
+    waiter  = TieredCache(remote)
+    remote.add('key@1/building', 'stalled worker')
+
+    assert waiter.get_or_build('key', lambda: 'built here', 1) == 'built here'
+    assert remote.values['key@1/building'] == 'stalled worker' # Not its lock to release
+
+def test_build_wait_leaves_time_to_build_before_the_worker_timeout():
+    assert cache.BUILD_WAIT < cache.WORKER_TIMEOUT / 2.0
+    assert cache.BUILD_LOCK_TTL <= cache.WORKER_TIMEOUT
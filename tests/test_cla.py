@@ -0,0 +1,52 @@
+from __future__ import absolute_import
+
+import numpy as np
+import pytest
+
+from lib.CLA import CLA
+
+
+def _random_problem(seed):
+    rng = np.random.RandomState(seed)
+    n   = rng.randint(2, 13)
+    A   = rng.randn(n, n)
+    return rng.rand(n) * 0.01, A.dot(A.T) / n * 1e-3 + np.eye(n) * 1e-5
+
+def _factor_problem(seed, n=18, factors=3):
+    rng         = np.random.RandomState(1000 + seed)
+    loadings    = rng.randn(n, factors) * 0.03
+    covariance  = loadings.dot(np.diag(rng.rand(factors) + 0.5)).dot(loadings.T) + np.diag((rng.rand(n) * 0.02 + 0.005) ** 2)
+    means       = 0.002 + loadings.dot(rng.rand(factors)) * 0.1 + rng.randn(n) * 0.001
+    return means, covariance
+
+def _solved(means, covariance, **kwargs):
+    n   = len(means)
+    cla = CLA(means.reshape((-1, 1)), covariance, np.zeros((n, 1)), np.ones((n, 1)))
+    cla.solve(**kwargs)
+    return cla
+
+PROBLEMS = [ _random_problem(seed) for seed in range(40) ] + [ _factor_problem(seed) for seed in range(60) ]
+
+
+@pytest.mark.parametrize('means, covariance', PROBLEMS)
+def test_solve_finishes_with_one_turning_point_per_lambda(means, covariance):
+    # Rounding errors used to free a weight again at the lambda it was bound
+    # at, and solve() never finished
+    n       = len(means)
+    cla     = _solved(means, covariance)
+    lambdas = [ l for l in cla.l if l is not None ]
+    weights = np.hstack(cla.w).T
+
+    assert len(cla.w) <= 2 * (n + 1)
+    assert all(np.diff(lambdas) < 0)
+    assert np.allclose(weights.sum(axis=1), 1)
+    assert weights.min() > -1e-9
+
+def test_solve_gives_up_after_max_iterations():
+    means, covariance = _factor_problem(4)
+    with pytest.raises(RuntimeError):
+        _solved(means, covariance, maxIter=2)
+
+def test_single_asset():
+    cla = _solved(np.array([ 0.01 ]), np.array([[ 0.002 ]]))
+    assert [ w.tolist() for w in cla.w ] == [[[ 1.0 ]]]
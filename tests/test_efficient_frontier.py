@@ -0,0 +1,40 @@
+from __future__ import absolute_import
+
+import numpy as np
+import pytest
+
+from lib.efficient_frontier import _cla_frontier, _solve_frontier
+
+
+def _monthly_problem(seed):
+    # Means and sample covariances of ten years of made-up monthly returns
+    rng         = np.random.RandomState(seed)
+    n           = rng.randint(3, 16)
+    returns     = rng.randn(120, n) * rng.uniform(0.01, 0.06, n) + rng.uniform(0.0, 0.01, n)
+    returns[:, 1:] += returns[:, :1] * 0.5
+    return returns.mean(axis=0), np.cov(returns.T)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_cla_frontier_matches_slsqp(seed):
+    R, C = _monthly_problem(seed)
+    cla_means, cla_variances, cla_weights       = _cla_frontier(R, C, 20)
+    slsqp_means, slsqp_variances, slsqp_weights = _solve_frontier(R, C, 0.002, 20)
+
+    # The CLA collapses targets below the minimum variance portfolio into it,
+    # compare the targets both solved for
+    matching = np.isclose(slsqp_means[:, np.newaxis], cla_means[np.newaxis, :], rtol=0, atol=1e-12)
+    slsqp_index, cla_index = np.nonzero(matching)
+    assert len(cla_index) >= len(cla_means) - 1
+
+    assert np.allclose(cla_weights.sum(axis=1), 1)
+    assert cla_weights.min() > -1e-9
+    assert np.allclose(cla_variances[cla_index], slsqp_variances[slsqp_index], rtol=1e-6, atol=0)
+    # The CLA's portfolios are exact - SLSQP can only be worse
+    assert np.all(cla_variances[cla_index] <= slsqp_variances[slsqp_index] * (1 + 1e-8))
+
+def test_cla_frontier_starts_at_minimum_variance():
+    R, C = _monthly_problem(0)
+    means, variances, weights = _cla_frontier(R, C, 50)
+    assert np.all(np.diff(means) > 0)
+    assert np.all(np.diff(variances) >= 0)
@@ -0,0 +1,116 @@
+from __future__ import absolute_import
+
+import time
+import datetime
+import threading
+
+import pytest
+import requests
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError: # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from lib import fetch
+
+
+QUANDL_CSV = b"Date,Value\n2014-02-28,2.0\n2014-01-31,1.0\n"
+YAHOO_CSV  = b"Date,Open,High,Low,Close,Volume,Adj Close\n2014-01-03,2,2,2,2,100,1.9\n2014-01-02,1,1,1,1,100,0.9\n"
+
+
+class _StandInServer(ThreadingMixIn, HTTPServer):
+    """
+    Local stand-in for Yahoo and Quandl. Answers every request with the next
+    scripted (status, body, delay) and records the paths it was asked for.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        self.responses  = []
+        self.requests   = []
+        self.lock       = threading.Lock()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self.server_address[1]
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append(self.path)
+            status, body, delay = self.server.responses.pop(0)
+        time.sleep(delay)
+        try:
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except Exception:
+            pass # Client gave up waiting
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    stand_in = _StandInServer()
+    thread = threading.Thread(target=stand_in.serve_forever)
+    thread.daemon = True
+    thread.start()
+    monkeypatch.setattr(fetch, 'YAHOO_HISTORY_URL', stand_in.url + '/table.csv')
+    monkeypatch.setattr(fetch, 'QUANDL_URL', stand_in.url + '/datasets')
+    monkeypatch.setattr(fetch, 'RETRIES', 2)
+    monkeypatch.setattr(fetch, 'BACKOFF', 0.01)
+    monkeypatch.setattr(fetch, 'TIMEOUT', 5.0)
+    yield stand_in
+    stand_in.shutdown()
+    stand_in.server_close()
+
+
+def test_retries_5xx_then_succeeds(server):
+    server.responses = [ (503, b'', 0), (500, b'', 0), (200, QUANDL_CSV, 0) ]
+    df = fetch.quandl("BOC/CDA_CPI", collapse="monthly")
+    assert len(server.requests) == 3
+    assert server.requests[0].startswith('/datasets/BOC/CDA_CPI.csv?')
+    assert 'collapse=monthly' in server.requests[0]
+    assert df['Value'].tolist() == [ 1.0, 2.0 ] # oldest first
+
+def test_gives_up_after_retries(server):
+    server.responses = [ (503, b'', 0) ] * 3
+    with pytest.raises(requests.exceptions.HTTPError):
+        fetch.quandl("BOC/CDA_CPI")
+    assert len(server.requests) == 3
+
+def test_does_not_retry_4xx(server):
+    server.responses = [ (404, b'', 0), (200, QUANDL_CSV, 0) ]
+    with pytest.raises(requests.exceptions.HTTPError):
+        fetch.quandl("BOC/MISSING")
+    assert len(server.requests) == 1
+
+def test_retries_timeout(server, monkeypatch):
+    monkeypatch.setattr(fetch, 'TIMEOUT', 0.2)
+    server.responses = [ (200, YAHOO_CSV, 1.0), (200, YAHOO_CSV, 0) ]
+    df = fetch.yahoo_prices('VTI', datetime.date(2014, 1, 1), datetime.date(2014, 1, 31))
+    assert len(server.requests) == 2
+    assert server.requests[0].startswith('/table.csv?')
+    assert df['Adjusted Close'].tolist() == [ 0.9, 1.9 ]
+
+def test_run_concurrently_keeps_order():
+    def slow_square(x):
+        time.sleep(0.01 * (5 - x))
+        return x * x
+    assert fetch.run_concurrently(slow_square, range(5), workers=5) == [ 0, 1, 4, 9, 16 ]
+    assert fetch.run_concurrently(slow_square, []) == []
+
+def test_run_concurrently_reraises():
+    def fail_on_three(x):
+        if x == 3:
+            raise ValueError("three")
+        return x
+    with pytest.raises(ValueError):
+        fetch.run_concurrently(fail_on_three, range(5), workers=2)
@@ -0,0 +1,33 @@
+from __future__ import absolute_import
+
+import pytest
+
+from lib.frontiers import validation_error
+from lib.universe import AssetUniverse
+
+
+class _MarketData(object):
+    # The parts of MarketData that validation looks at
+    universe    = AssetUniverse([ 'US-STOCK', 'INTL-STOCK', 'US-BOND' ])
+    covariances = { 'covariance_matrix': None, 'ewma_covariance_matrix': None }
+
+
+def test_valid_request():
+    assert validation_error(_MarketData(), [ 'US-BOND', 'US-STOCK' ], True, 'cla', 50, 'ewma_covariance_matrix') is None
+
+@pytest.mark.parametrize('asset_ids, method, points, covariance_source', [
+    ('US-STOCK',                    'slsqp',    20,     'covariance_matrix'),
+    (5,                             'slsqp',    20,     'covariance_matrix'),
+    ([ 1, 2 ],                      'slsqp',    20,     'covariance_matrix'),
+    ([],                            'slsqp',    20,     'covariance_matrix'),
+    ([ 'US-STOCK', 'US-STOCK' ],    'slsqp',    20,     'covariance_matrix'),
+    ([ 'US-STOCK', 'ZZZ' ],         'slsqp',    20,     'covariance_matrix'),
+    ([ 'US-STOCK' ],                5,          20,     'covariance_matrix'),
+    ([ 'US-STOCK' ],                'newton',   20,     'covariance_matrix'),
+    ([ 'US-STOCK' ],                'slsqp',    True,   'covariance_matrix'),
+    ([ 'US-STOCK' ],                'slsqp',    5,      'covariance_matrix'),
+    ([ 'US-STOCK' ],                'slsqp',    20,     [ 'covariance_matrix' ]),
+    ([ 'US-STOCK' ],                'slsqp',    20,     'five_year_covariance_matrix'),
+])
+def test_invalid_request(asset_ids, method, points, covariance_source):
+    assert validation_error(_MarketData(), asset_ids, True, method, points, covariance_source) is not None
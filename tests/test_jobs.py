@@ -0,0 +1,86 @@
+from __future__ import absolute_import
+
+import pytest
+
+from lib import jobs
+from lib import frontiers
+
+
+class _Pool(object):
+    # Stand-in for the frontier process pool - jobs finish when finish() is called
+    def __init__(self):
+        self.callbacks = []
+
+    def apply_async(self, function, args, callback):
+        self.callbacks.append(lambda: callback(function(*args)))
+
+    def finish(self):
+        while self.callbacks:
+            self.callbacks.pop(0)()
+
+class _Store(jobs.LocalJobStore):
+    # Records whether the job was still being kept alive when each state was saved
+    def __init__(self):
+        jobs.LocalJobStore.__init__(self)
+        self.saved = []
+
+    def save(self, job_id, state):
+        self.saved.append((state["status"], 'name' in jobs._held))
+        jobs.LocalJobStore.save(self, job_id, state)
+
+
+@pytest.fixture
+def solve(monkeypatch):
+    results = []
+    monkeypatch.setattr(frontiers, '_solve', lambda job: results.pop(0))
+    monkeypatch.setattr(jobs, '_held', {})
+    return results
+
+
+def test_solved_job(solve):
+    store, pool, solved = _Store(), _Pool(), []
+    solve.append(({ "portfolios": [] }, None))
+    job_id = frontiers.submit(store, 'job', 'name', pool, on_solved=solved.append)
+    assert store.load(job_id) == { "status": jobs.PENDING }
+    assert 'name' in jobs._held
+
+    pool.finish()
+    assert store.load(job_id) == { "status": jobs.DONE, "result": { "portfolios": [] } }
+    assert solved == [ '{"portfolios": []}' ]
+    assert store._running == {}
+    assert jobs._held == {}
+    # The heartbeat stopped before the final state was saved
+    assert store.saved == [ (jobs.PENDING, False), (jobs.DONE, False) ]
+
+def test_failed_job(solve):
+    store, pool, solved = _Store(), _Pool(), []
+    solve.append((None, "Iteration limit reached"))
+    job_id = frontiers.submit(store, 'job', 'name', pool, on_solved=solved.append)
+    pool.finish()
+    assert store.load(job_id) == { "status": jobs.FAILED, "error": "Iteration limit reached" }
+    assert solved == []
+    assert store._running == {}
+    assert jobs._held == {}
+
+def test_running_job_is_not_solved_again(solve):
+    store, pool = _Store(), _Pool()
+    solve.append(({ "portfolios": [] }, None))
+    first   = frontiers.submit(store, 'job', 'name', pool)
+    second  = frontiers.submit(store, 'job', 'name', pool)
+    assert second == first
+    assert list(store._states.keys()) == [ first ] # No orphaned pending state
+    assert len(pool.callbacks) == 1
+
+    pool.finish()
+    solve.append(({ "portfolios": [] }, None))
+    assert frontiers.submit(store, 'job', 'name', pool) != first
+
+def test_expired_running_job_is_taken_over(solve):
+    store, pool = _Store(), _Pool()
+    solve.append(({ "portfolios": [] }, None))
+    store.claim('name', 'dead job') # Its state expired with its process
+    job_id = frontiers.submit(store, 'job', 'name', pool)
+    assert job_id != 'dead job'
+    assert store._running['name'] == job_id
+    pool.finish()
+    assert store.load(job_id)["status"] == jobs.DONE
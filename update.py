@@ -1,46 +1,69 @@
 from __future__ import absolute_import
 
 import os
-import redis
+
 
 from lib.inflation    import inflation_json                   as inflation_json
 from lib.real_estate  import real_estate_json                 as real_estate_json
 from lib.etfs         import etf_json                         as etf_json
 from lib.etfs         import quotes_json                      as quotes_json
+from lib.assets       import refresh_prices                   as refresh_prices
 from lib.assets       import asset_json                       as asset_json
+from lib.assets       import panel_data                       as panel_data
 from lib.assets       import mean_return_json                 as mean_return_json
 from lib.assets       import five_year_mean_return_json       as five_year_mean_return_json
 from lib.assets       import reverse_optimized_returns_json   as reverse_optimized_returns_json
 from lib.assets       import std_dev_returns_json             as std_dev_returns_json
 from lib.assets       import covariance_matrix_json           as covariance_matrix_json
 from lib.assets       import cholesky_decomposition_json      as cholesky_decomposition_json
+from lib.assets       import mean_return_binary               as mean_return_binary
+from lib.assets       import five_year_mean_return_binary     as five_year_mean_return_binary
+from lib.assets       import reverse_optimized_returns_binary as reverse_optimized_returns_binary
+from lib.assets       import std_dev_returns_binary           as std_dev_returns_binary
+from lib.assets       import covariance_matrix_binary         as covariance_matrix_binary
+from lib.assets       import cholesky_decomposition_binary    as cholesky_decomposition_binary
+from lib.assets       import excess_return_covariance_binary  as excess_return_covariance_binary
+from lib.assets       import market_portfolio_weights_binary  as market_portfolio_weights_binary
+from lib.assets       import macro_mean_returns_binary        as macro_mean_returns_binary
+from lib.assets       import macro_covariance_binary          as macro_covariance_binary
+from lib.assets       import ewma_returns_binary              as ewma_returns_binary
+from lib.assets       import ewma_covariance_matrix_binary    as ewma_covariance_matrix_binary
+from lib.assets       import return_sums_binary               as return_sums_binary
+from lib.assets       import return_product_sums_binary       as return_product_sums_binary
 from lib.cache        import clear                            as clear_cache
+from lib.fetch        import run_concurrently                 as run_concurrently
+from lib.cache        import client                           as memcache_client
+from lib.cache        import TieredCache                      as TieredCache
+from lib.frontiers    import prewarm                          as prewarm_frontiers
+from lib.market_data  import GENERATION_KEY                   as GENERATION_KEY
+from lib.market_data  import binary_key                       as binary_key
+from lib.market_data  import current_generation               as current_generation
+from lib.market_data  import panel_path                       as panel_path
+from lib.panel        import write                            as write_panel
+from lib.redis_client import client                           as redis_client
 
 
 #################
 
-def _get_redis_connection():
-    redis_url   = os.getenv('REDIS_URL')
-    if redis_url is None:
-        raise KeyError("%s not present" % "REDIS_URL")
-    r  = redis.StrictRedis.from_url(redis_url)
-    # r = redis.StrictRedis(db=6) ## Development
-    return r
-
-#################
+print("Refreshing historical prices....")
+refresh_prices()
 
+print("Fetching quotes and macro series....")
+inflation, real_estate, quotes = run_concurrently(lambda build: build(), [inflation_json, real_estate_json, quotes_json])
 
 print("Updating finance data in Redis....")
 
-pipe = _get_redis_connection().pipeline()
+redis_conn = redis_client()
+
+pipe = redis_conn.pipeline()
 
 pipe.multi() # Execute as multi so all data refreshed at once
 
 pipe.set(name='asset_list',                 value=asset_json())
 pipe.set(name='etf_list',                   value=etf_json())
-pipe.set(name='inflation',                  value=inflation_json())
-pipe.set(name='real_estate',                value=real_estate_json())
-pipe.set(name='quotes',                     value=quotes_json())
+pipe.set(name='inflation',                  value=inflation)
+pipe.set(name='real_estate',                value=real_estate)
+pipe.set(name='quotes',                     value=quotes)
 pipe.set(name='mean_returns',               value=mean_return_json()) # Historical returns (all data)
 pipe.set(name='five_year_returns',          value=five_year_mean_return_json()) # Rolling 5 year returns
 pipe.set(name='reverse_optimized_returns',  value=reverse_optimized_returns_json()) # Market implied returns
@@ -48,13 +71,46 @@ pipe.set(name='std_dev_returns',            value=std_dev_returns_json())
 pipe.set(name='covariance_matrix',          value=covariance_matrix_json())
 pipe.set(name='cholesky_decomposition',     value=cholesky_decomposition_json())
 
+# Packed float64 copies of the numeric data - read by the server (see lib/binary.py)
+pipe.set(name=binary_key('mean_returns'),               value=mean_return_binary())
+pipe.set(name=binary_key('five_year_returns'),          value=five_year_mean_return_binary())
+pipe.set(name=binary_key('reverse_optimized_returns'),  value=reverse_optimized_returns_binary())
+pipe.set(name=binary_key('std_dev_returns'),            value=std_dev_returns_binary())
+pipe.set(name=binary_key('covariance_matrix'),          value=covariance_matrix_binary())
+pipe.set(name=binary_key('cholesky_decomposition'),     value=cholesky_decomposition_binary())
+pipe.set(name=binary_key('excess_return_covariance'),   value=excess_return_covariance_binary()) # Reverse optimization inputs - see /implied_returns
+pipe.set(name=binary_key('market_portfolio_weights'),   value=market_portfolio_weights_binary())
+pipe.set(name=binary_key('macro_mean_returns'),         value=macro_mean_returns_binary()) # Joint inflation / real estate statistics - see /retirement
+pipe.set(name=binary_key('macro_covariance'),           value=macro_covariance_binary())
+pipe.set(name=binary_key('ewma_returns'),               value=ewma_returns_binary()) # Exponentially weighted estimates - see covariance_source
+pipe.set(name=binary_key('ewma_covariance_matrix'),     value=ewma_covariance_matrix_binary())
+pipe.set(name=binary_key('return_sums'),                value=return_sums_binary()) # Prefix sums for windowed statistics - see lib/rolling
+pipe.set(name=binary_key('return_product_sums'),        value=return_product_sums_binary())
+
+pipe.incr(GENERATION_KEY) # Tells server workers to reload their parsed copy of the data
+
+if panel_path():
+    # Swapped in before the generation is bumped, so workers on this machine map
+    # it as soon as they see the new generation
+    print("Writing shared market data panel....")
+    tickers, asset_ids, arrays = panel_data()
+    write_panel(panel_path(), current_generation(redis_conn) + 1, tickers, asset_ids, arrays)
+
 pipe.execute()
 
 #################
 
+# Values cached for older generations are never served again - this only
+# frees their memory
 print("Clearing cache.....")
 clear_cache()
 
 #################
 
+print("Prewarming most requested efficient frontiers.....")
+prewarmed = prewarm_frontiers(redis_conn, TieredCache(memcache_client(), size=0), count=int(os.getenv('PREWARM_COUNT', 50)))
+print("Prewarmed %d frontiers" % prewarmed)
+
+#################
+
 print("Done!")